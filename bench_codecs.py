@@ -0,0 +1,91 @@
+"""存储编码基准测试
+
+生成一份大型的模拟错题集，对比各种编码 / 压缩组合的编码耗时、解码耗时和文件大小：
+
+    python bench_codecs.py -n 50000
+
+未安装 orjson / msgpack / zstandard 时对应的组合会被跳过。
+"""
+import argparse
+import json
+import random
+import time
+
+import main
+
+
+def synthetic_mistakes(count, seed=0):
+    rng = random.Random(seed)
+    subjects = {
+        "数学": ["代数", "几何", "函数", "概率统计"],
+        "物理": ["力学", "电磁学", "光学", "热学"],
+        "英语": ["语法", "阅读理解", "写作", "听力"],
+    }
+    words = ["已知", "函数", "求", "的最小值", "证明", "三角形", "加速度", "受力分析", "定语从句", "根据短文", "解得", "因此"]
+    mistakes = []
+    for i in range(count):
+        subject = rng.choice(list(subjects))
+        mistakes.append({
+            "id": f"2025{i:016d}",
+            "subject": subject,
+            "chapter": rng.choice(subjects[subject]),
+            "title": "".join(rng.choice(words) for _ in range(rng.randint(2, 5))),
+            "description": "".join(rng.choice(words) for _ in range(rng.randint(20, 80))),
+            "answer": "".join(rng.choice(words) for _ in range(rng.randint(0, 30))),
+            "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+            "images": [f"mistakes_data/images/2025{i:016d}_{k}.png" for k in range(rng.randint(0, 3))],
+        })
+    return mistakes
+
+
+def measure(encode, decode, obj, repeat):
+    encode_times = []
+    decode_times = []
+    data = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = encode(obj)
+        encode_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        decode(data)
+        decode_times.append(time.perf_counter() - start)
+    return min(encode_times), min(decode_times), len(data)
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="存储编码基准测试")
+    parser.add_argument("-n", "--count", type=int, default=50000, help="模拟错题数量")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="每种组合重复次数，取最快一次")
+    args = parser.parse_args()
+
+    mistakes = synthetic_mistakes(args.count)
+
+    # 基准：旧版本的带缩进 JSON 和标准库紧凑 JSON
+    cases = [
+        ("旧格式 json indent=2",
+         lambda obj: json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8'),
+         lambda data: json.loads(data.decode('utf-8'))),
+        ("标准库紧凑 json",
+         lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+         lambda data: json.loads(data.decode('utf-8'))),
+    ]
+    for codec, (_, _, _, available) in main.STORAGE_CODECS.items():
+        for compression, (_, _, _, compression_available) in main.STORAGE_COMPRESSIONS.items():
+            if not available() or not compression_available():
+                continue
+            name = codec + (" (orjson)" if codec == "json" and main.orjson is not None else "")
+            if compression != "none":
+                name += f" + {compression}"
+            cases.append((name,
+                          lambda obj, c=codec, z=compression: main.encode_data(obj, c, z),
+                          main.decode_data))
+
+    print(f"模拟错题: {args.count} 条，每种组合取 {args.repeat} 次中最快一次")
+    print(f"{'编码方式':<28}{'编码(ms)':>12}{'解码(ms)':>12}{'大小(KB)':>12}")
+    for name, encode, decode in cases:
+        encode_time, decode_time, size = measure(encode, decode, mistakes, args.repeat)
+        print(f"{name:<28}{encode_time * 1000:>12.1f}{decode_time * 1000:>12.1f}{size / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,106 @@
+"""学霸错题本共享服务压力测试
+
+先在错题本中开启共享服务（或使用 python main.py --serve），然后运行：
+
+    python loadtest.py --url http://127.0.0.1:8765 -n 2000 -c 16
+
+脚本会先读取 /api/tree 和错题列表，生成一组混合请求（学科树、分页列表、错题详情、缩略图），
+并发执行后输出每秒请求数和延迟分位数。加 --etag 时会带上 If-None-Match，测试条件请求。
+"""
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+
+def fetch_json(base_url, path):
+    with urllib.request.urlopen(base_url + path, timeout=10) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def build_paths(base_url, max_details=200):
+    """根据服务端现有数据生成待测试的请求路径"""
+    paths = ["/api/tree"]
+    tree = fetch_json(base_url, "/api/tree")
+
+    for subject in tree["subjects"]:
+        paths.append(f"/api/mistakes?subject={quote(subject['name'])}")
+        for chapter in subject["chapters"]:
+            if chapter["count"]:
+                paths.append(f"/api/mistakes?subject={quote(subject['name'])}&chapter={quote(chapter['name'])}")
+
+    listing = fetch_json(base_url, f"/api/mistakes?per_page={max_details}")
+    for item in listing["items"]:
+        paths.append(f"/api/mistakes/{quote(item['id'])}")
+        if item["image_count"]:
+            paths.append(f"/api/mistakes/{quote(item['id'])}/images/0?size=thumb")
+
+    return paths
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(base_url, paths, total, concurrency, use_etag):
+    etags = {}
+
+    def request(path):
+        req = urllib.request.Request(base_url + path)
+        if use_etag and path in etags:
+            req.add_header("If-None-Match", etags[path])
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=10) as response:
+                response.read()
+                status = response.status
+                if response.headers.get("ETag"):
+                    etags[path] = response.headers["ETag"]
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = "error"
+        return status, time.perf_counter() - start
+
+    plan = [random.choice(paths) for _ in range(total)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(request, plan))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"请求数: {total}  并发: {concurrency}  不同路径: {len(set(paths))}")
+    print(f"总耗时: {elapsed:.2f}s  吞吐: {total / elapsed:.1f} 请求/秒")
+    print("延迟: " + "  ".join(
+        f"{name}={percentile(latencies, fraction) * 1000:.2f}ms"
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+    ))
+    print("状态码: " + "  ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="学霸错题本共享服务压力测试")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="共享服务地址")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="总请求数")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="并发数")
+    parser.add_argument("--etag", action="store_true", help="发送 If-None-Match 条件请求")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    paths = build_paths(base_url)
+    run(base_url, paths, args.requests, args.concurrency, args.etag)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,1435 @@ import zipfile
 import threading
 import sys
 import tempfile
+import bisect
+import base64
+import html
+import io
+import gzip
+import hashlib
+import socket
+import argparse
+import select
+import struct
+import time
+import ctypes
+import ctypes.util
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, quote, unquote
+from concurrent.futures import ProcessPoolExecutor
+
+# 跨进程文件锁：POSIX 使用 fcntl，Windows 使用 msvcrt
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# 可选依赖：安装后自动用于存储编码 / 压缩
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 可选依赖：安装 weasyprint 后练习卷可直接导出 PDF
+try:
+    from weasyprint import HTML as WeasyHTML
+except ImportError:
+    WeasyHTML = None
+
+
+def _json_encode(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _json_decode(data):
+    if orjson is not None:
+        # orjson 不接受 BOM，旧文件可能由记事本保存
+        return orjson.loads(data[3:] if data.startswith(b'\xef\xbb\xbf') else data)
+    return json.loads(data.decode('utf-8-sig'))
+
+
+def _msgpack_encode(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _msgpack_decode(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# 存储编码：名称 -> (头部编号, 编码函数, 解码函数, 是否可用)
+STORAGE_CODECS = {
+    "json": (1, _json_encode, _json_decode, lambda: True),
+    "msgpack": (2, _msgpack_encode, _msgpack_decode, lambda: msgpack is not None),
+}
+
+# 压缩方式：名称 -> (头部编号, 压缩函数, 解压函数, 是否可用)
+STORAGE_COMPRESSIONS = {
+    "none": (0, lambda data: data, lambda data: data, lambda: True),
+    "gzip": (1, lambda data: gzip.compress(data, compresslevel=6, mtime=0), gzip.decompress, lambda: True),
+    "zstd": (2, _zstd_compress, _zstd_decompress, lambda: zstandard is not None),
+}
+
+# 文件头：4 字节标识 + 1 字节编码编号 + 1 字节压缩编号
+# 紧凑 JSON 且不压缩时不写文件头，与旧版本的 .json 文件完全兼容
+STORAGE_MAGIC = b"MKB\x01"
+STORAGE_CODEC = "json"
+STORAGE_COMPRESSION = "none"
+
+
+def encode_data(obj, codec=STORAGE_CODEC, compression=STORAGE_COMPRESSION):
+    if codec not in STORAGE_CODECS or not STORAGE_CODECS[codec][3]():
+        raise ValueError(f"不可用的编码方式: {codec}")
+    if compression not in STORAGE_COMPRESSIONS or not STORAGE_COMPRESSIONS[compression][3]():
+        raise ValueError(f"不可用的压缩方式: {compression}")
+
+    codec_id, encode, _, _ = STORAGE_CODECS[codec]
+    compression_id, compress, _, _ = STORAGE_COMPRESSIONS[compression]
+    payload = encode(obj)
+    if codec == "json" and compression == "none":
+        return payload
+    return STORAGE_MAGIC + bytes((codec_id, compression_id)) + compress(payload)
+
+
+def detect_data_format(data):
+    """返回数据使用的 (编码, 压缩) 名称，没有文件头的视为不压缩的 JSON；无法识别时返回 None"""
+    if not data.startswith(STORAGE_MAGIC):
+        return "json", "none"
+    codec = next((name for name, v in STORAGE_CODECS.items() if v[0] == data[4]), None)
+    compression = next((name for name, v in STORAGE_COMPRESSIONS.items() if v[0] == data[5]), None)
+    if codec is None or compression is None:
+        return None
+    return codec, compression
+
+
+def decode_data(data):
+    """按文件头解码，没有文件头的按 JSON 读取（兼容旧版本）"""
+    if not data.startswith(STORAGE_MAGIC):
+        return _json_decode(data)
+
+    codec_id, compression_id = data[4], data[5]
+    codec = next((v for v in STORAGE_CODECS.values() if v[0] == codec_id), None)
+    compression = next((v for v in STORAGE_COMPRESSIONS.values() if v[0] == compression_id), None)
+    if codec is None or compression is None:
+        raise ValueError(f"未知的数据格式: 编码 {codec_id}，压缩 {compression_id}")
+    if not codec[3]() or not compression[3]():
+        raise ValueError("数据文件使用的编码或压缩方式需要安装额外的库（msgpack / zstandard）")
+
+    try:
+        return codec[2](compression[2](data[6:]))
+    except Exception as e:
+        raise ValueError(f"数据文件已损坏: {str(e)}") from e
+
+
+def read_data_file(file_path, with_format=False):
+    """读取数据文件；with_format 为 True 时同时返回文件的 (编码, 压缩) 名称"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    obj = decode_data(data)
+    return (obj, detect_data_format(data)) if with_format else obj
+
+
+def write_data_file(file_path, obj, codec=STORAGE_CODEC, compression=STORAGE_COMPRESSION):
+    """先写临时文件再替换，其他程序不会读到写了一半的文件"""
+    data = encode_data(obj, codec, compression)
+    temp_path = file_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, file_path)
+
+
+class MonotonicIdGenerator:
+    """ULID 风格的唯一 ID：48 位毫秒时间戳 + 80 位随机数，Crockford Base32 编码为 26 个字符
+
+    同一毫秒内（或系统时钟回拨时）在上一个 ID 的随机部分上加一，保证生成的 ID 严格递增，
+    字符串顺序即生成顺序。
+    """
+
+    ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+    LENGTH = 26
+    RANDOM_BITS = 80
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_time = 0
+        self.last_random = 0
+
+    def new_id(self):
+        with self.lock:
+            now = int(time.time() * 1000)
+            if now > self.last_time:
+                self.last_time = now
+                self.last_random = int.from_bytes(os.urandom(10), 'big')
+            else:
+                self.last_random += 1
+                if self.last_random >> self.RANDOM_BITS:
+                    # 同一毫秒内随机部分溢出，借用下一毫秒
+                    self.last_time += 1
+                    self.last_random = int.from_bytes(os.urandom(10), 'big')
+            return self.encode((self.last_time << self.RANDOM_BITS) | self.last_random)
+
+    @classmethod
+    def id_for_timestamp(cls, timestamp_ms):
+        """按指定时间生成 ID（用于迁移旧数据），不参与单调递增"""
+        value = (int(timestamp_ms) << cls.RANDOM_BITS) | int.from_bytes(os.urandom(10), 'big')
+        return cls.encode(value)
+
+    @classmethod
+    def encode(cls, value):
+        chars = []
+        for _ in range(cls.LENGTH):
+            chars.append(cls.ALPHABET[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+    @classmethod
+    def is_valid(cls, value):
+        return (isinstance(value, str) and len(value) == cls.LENGTH
+                and value[0] in "01234567" and all(c in cls.ALPHABET for c in value))
+
+    @staticmethod
+    def legacy_timestamp(mistake):
+        """旧 ID（%Y%m%d%H%M%S%f）或 date 字段对应的毫秒时间戳，都无法解析时返回 None"""
+        candidates = [(str(mistake.get('id', '')), "%Y%m%d%H%M%S%f"),
+                      (str(mistake.get('date', '')), "%Y-%m-%d %H:%M:%S")]
+        for value, fmt in candidates:
+            try:
+                return int(datetime.datetime.strptime(value, fmt).timestamp() * 1000)
+            except (ValueError, OverflowError, OSError):
+                continue
+        return None
+
+
+def _bits_from_positions(positions, size):
+    """把位置列表转换为位图（Python 大整数），避免逐位 OR 产生大量临时对象"""
+    buf = bytearray((size + 7) // 8)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def _positions_from_bits(bits):
+    """把位图展开为升序的位置列表"""
+    positions = []
+    if bits <= 0:
+        return positions
+    text = bin(bits)[:1:-1]
+    pos = text.find('1')
+    while pos != -1:
+        positions.append(pos)
+        pos = text.find('1', pos + 1)
+    return positions
+
+
+class MistakeIndex:
+    """错题二级索引
+
+    - 日期：按 date 字段排序的列表，区间查询使用二分查找
+    - 学科 / 章节 / 是否有图片 / 是否缺少答案：位图，组合条件用按位与求交集
+    """
+
+    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+    SORT_KEYS = {
+        "date": lambda m: m.get('date', ''),
+        "title": lambda m: m.get('title', ''),
+        "subject": lambda m: (m.get('subject', ''), m.get('chapter', ''), m.get('date', '')),
+    }
+
+    def __init__(self, mistakes):
+        self.mistakes = list(mistakes)
+        size = len(self.mistakes)
+        self.size = size
+        self.all_bits = (1 << size) - 1
+
+        subject_positions = {}
+        chapter_positions = {}
+        image_positions = []
+        no_answer_positions = []
+        dated = []
+
+        for pos, mistake in enumerate(self.mistakes):
+            subject = mistake.get('subject', '')
+            chapter = mistake.get('chapter', '')
+            subject_positions.setdefault(subject, []).append(pos)
+            chapter_positions.setdefault((subject, chapter), []).append(pos)
+            if mistake.get('images'):
+                image_positions.append(pos)
+            if not str(mistake.get('answer', '')).strip():
+                no_answer_positions.append(pos)
+            date_key = self.normalize_date(mistake.get('date'))
+            if date_key:
+                dated.append((date_key, pos))
+
+        self.subject_bits = {k: _bits_from_positions(v, size) for k, v in subject_positions.items()}
+        self.chapter_bits = {k: _bits_from_positions(v, size) for k, v in chapter_positions.items()}
+        self.image_bits = _bits_from_positions(image_positions, size)
+        self.no_answer_bits = _bits_from_positions(no_answer_positions, size)
+
+        # 日期统一为 "YYYY-MM-DD HH:MM:SS"，字符串顺序即时间顺序
+        dated.sort()
+        self.date_keys = [key for key, _ in dated]
+        self.date_positions = [pos for _, pos in dated]
+
+    @classmethod
+    def normalize_date(cls, value, end_of_day=False):
+        """把日期（字符串 / date / datetime）转换为可比较的索引键，无法解析时返回 None"""
+        if value is None or value == '':
+            return None
+        if isinstance(value, datetime.datetime):
+            return value.strftime(cls.DATE_FORMAT)
+        if isinstance(value, datetime.date):
+            value = value.strftime("%Y-%m-%d")
+        value = str(value).strip()
+        # 快速路径：程序写入的日期本身就是标准格式，建索引时无需逐条 strptime
+        if len(value) == 19 and value[4] == '-' and value[7] == '-' and value[10] == ' ' \
+                and value[:4].isdigit() and value[11:13].isdigit():
+            return value
+        for fmt, length in ((cls.DATE_FORMAT, 19), ("%Y-%m-%d %H:%M", 16), ("%Y-%m-%d", 10)):
+            try:
+                parsed = datetime.datetime.strptime(value[:length], fmt)
+            except ValueError:
+                continue
+            if length == 10 and end_of_day:
+                parsed = parsed.replace(hour=23, minute=59, second=59)
+            elif length == 16 and end_of_day:
+                parsed = parsed.replace(second=59)
+            return parsed.strftime(cls.DATE_FORMAT)
+        return None
+
+    def date_range_bits(self, date_from=None, date_to=None):
+        lo = 0
+        hi = len(self.date_keys)
+        if date_from is not None:
+            start = self.normalize_date(date_from)
+            if start is None:
+                raise ValueError(f"无法识别的开始日期: {date_from}")
+            lo = bisect.bisect_left(self.date_keys, start)
+        if date_to is not None:
+            end = self.normalize_date(date_to, end_of_day=True)
+            if end is None:
+                raise ValueError(f"无法识别的结束日期: {date_to}")
+            hi = bisect.bisect_right(self.date_keys, end)
+        if lo >= hi:
+            return 0
+        if lo == 0 and hi == len(self.date_positions) and hi == self.size:
+            return self.all_bits
+        return _bits_from_positions(self.date_positions[lo:hi], self.size)
+
+    def query(self, subjects=None, chapters=None, date_from=None, date_to=None,
+              has_images=None, answer_missing=None, sort_by="date", reverse=False):
+        """组合查询
+
+        subjects: 学科列表，None 表示不限
+        chapters: (学科, 章节) 列表，None 表示不限
+        date_from / date_to: 日期区间（含两端），"YYYY-MM-DD" 只写日期时结束日期取当天 23:59:59
+        has_images / answer_missing: True / False 筛选，None 表示不限
+        sort_by: "date" / "title" / "subject"，None 表示保持录入顺序
+        """
+        bits = self.all_bits
+
+        if subjects is not None:
+            subject_bits = 0
+            for subject in subjects:
+                subject_bits |= self.subject_bits.get(subject, 0)
+            bits &= subject_bits
+
+        if chapters is not None:
+            chapter_bits = 0
+            for key in chapters:
+                chapter_bits |= self.chapter_bits.get(tuple(key), 0)
+            bits &= chapter_bits
+
+        if has_images is True:
+            bits &= self.image_bits
+        elif has_images is False:
+            bits &= ~self.image_bits
+
+        if answer_missing is True:
+            bits &= self.no_answer_bits
+        elif answer_missing is False:
+            bits &= ~self.no_answer_bits
+
+        if date_from is not None or date_to is not None:
+            bits &= self.date_range_bits(date_from, date_to)
+
+        results = [self.mistakes[pos] for pos in _positions_from_bits(bits & self.all_bits)]
+
+        if sort_by is None:
+            if reverse:
+                results.reverse()
+            return results
+        if sort_by not in self.SORT_KEYS:
+            raise ValueError(f"不支持的排序方式: {sort_by}")
+        results.sort(key=self.SORT_KEYS[sort_by], reverse=reverse)
+        return results
+
+
+def estimate_size(value):
+    """粗略估算缓存对象占用的字节数"""
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands()) + 256
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) + 64
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 64
+    if isinstance(value, (list, tuple)):
+        # 嵌套的列表、字符串、图片按内容计算；其他元素（如错题记录）只是引用，按 8 字节计
+        return 64 + sum(estimate_size(item) if isinstance(item, (bytes, str, Image.Image, list, tuple)) else 8
+                        for item in value)
+    if isinstance(value, dict):
+        return 64 + 100 * len(value)
+    return sys.getsizeof(value)
+
+
+class CacheManager:
+    """进程内统一缓存
+
+    缓存按名称划分区域（图片、列表、查询结果、共享服务响应等），所有区域共享一个全局字节预算。
+    条目统一放在一个 LRU 队列中，超出预算时从最久未使用的条目开始淘汰，单个超过预算 1/4 的对象不缓存。
+    每个区域分别统计命中、未命中、淘汰次数；invalidate 会调用已注册的失效回调。
+    每次失效都会推进对应区域的代数：先用 generation() 取得代数再生成数据，put 时传入该代数，
+    若期间发生过失效则丢弃这次写入，避免用旧数据生成的结果在失效之后写回缓存。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.stats = {}
+        self.hooks = []
+        self.epoch = 0
+        self.generations = {}
+        self.lock = threading.RLock()
+
+    def generation(self, region):
+        """返回区域当前的代数，用于 put 时检查数据在生成期间是否失效"""
+        with self.lock:
+            return self.epoch, self.generations.get(region, 0)
+
+    def region_stats(self, region):
+        stats = self.stats.get(region)
+        if stats is None:
+            stats = self.stats[region] = {"hits": 0, "misses": 0, "evictions": 0,
+                                          "invalidations": 0, "entries": 0, "bytes": 0}
+        return stats
+
+    def get(self, region, key, default=None):
+        with self.lock:
+            stats = self.region_stats(region)
+            entry = self.entries.get((region, key))
+            if entry is None:
+                stats["misses"] += 1
+                return default
+            self.entries.move_to_end((region, key))
+            stats["hits"] += 1
+            return entry[0]
+
+    def put(self, region, key, value, size=None, generation=None):
+        if size is None:
+            size = estimate_size(value)
+        with self.lock:
+            if generation is not None and generation != (self.epoch, self.generations.get(region, 0)):
+                return value
+            stats = self.region_stats(region)
+            self._remove((region, key))
+            if size > self.max_bytes // 4:
+                return value
+            self.entries[(region, key)] = (value, size)
+            stats["entries"] += 1
+            stats["bytes"] += size
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes and self.entries:
+                evicted_key = next(iter(self.entries))
+                self._remove(evicted_key)
+                self.region_stats(evicted_key[0])["evictions"] += 1
+        return value
+
+    def get_or_create(self, region, key, factory, size=None):
+        """命中时直接返回，否则调用 factory 生成并缓存；生成期间区域失效时只返回结果，不写入缓存"""
+        marker = object()
+        generation = self.generation(region)
+        value = self.get(region, key, marker)
+        if value is marker:
+            value = factory()
+            self.put(region, key, value, size(value) if callable(size) else size, generation)
+        return value
+
+    def _remove(self, full_key):
+        entry = self.entries.pop(full_key, None)
+        if entry is not None:
+            stats = self.region_stats(full_key[0])
+            stats["entries"] -= 1
+            stats["bytes"] -= entry[1]
+            self.total_bytes -= entry[1]
+
+    def invalidate(self, region=None, key=None, match=None):
+        """使缓存失效：region 为 None 时清空全部；指定 key 或 match(key) 时只删除对应条目"""
+        with self.lock:
+            if region is None:
+                targets = list(self.entries)
+            elif key is not None:
+                targets = [(region, key)] if (region, key) in self.entries else []
+            else:
+                targets = [k for k in self.entries if k[0] == region and (match is None or match(k[1]))]
+            for full_key in targets:
+                self._remove(full_key)
+            if region is None:
+                self.epoch += 1
+            else:
+                self.generations[region] = self.generations.get(region, 0) + 1
+            for name in ([region] if region is not None else list(self.stats)):
+                self.region_stats(name)["invalidations"] += 1
+            hooks = list(self.hooks)
+
+        for hook in hooks:
+            hook(region, key)
+
+    def add_invalidation_hook(self, callback):
+        """注册失效回调 callback(region, key)，region 为 None 表示全部清空"""
+        with self.lock:
+            self.hooks.append(callback)
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}, self.total_bytes
+
+    def format_stats(self):
+        stats, total = self.snapshot()
+        lines = [f"缓存占用: {total / 1024 / 1024:.1f} MB / {self.max_bytes / 1024 / 1024:.1f} MB",
+                 f"{'区域':<12}{'条目':>8}{'占用(KB)':>12}{'命中':>10}{'未命中':>10}{'命中率':>9}{'淘汰':>8}{'失效':>8}"]
+        for name in sorted(stats):
+            item = stats[name]
+            requests = item["hits"] + item["misses"]
+            rate = f"{item['hits'] / requests * 100:.1f}%" if requests else "-"
+            lines.append(f"{name:<12}{item['entries']:>8}{item['bytes'] / 1024:>12.1f}{item['hits']:>10}"
+                         f"{item['misses']:>10}{rate:>9}{item['evictions']:>8}{item['invalidations']:>8}")
+        return "\n".join(lines)
+
+
+# 单次解码的像素上限：预览、缩略图、练习卷和查看器都通过 open_reduced 解码，
+# JPEG 按 draft 缩小后的尺寸计算，其他格式按原图尺寸计算
+MAX_DECODE_PIXELS = 40_000_000
+
+
+def open_reduced(image_path, target_size):
+    """打开图片并尽量按目标尺寸缩小解码（JPEG 使用 draft 模式，按 1/2、1/4、1/8 直接解码）
+
+    需要解码的像素数超过 MAX_DECODE_PIXELS 时抛出 ValueError。
+    """
+    img = Image.open(image_path)
+    width = max(1, int(target_size[0]))
+    height = max(1, int(target_size[1]))
+    if width < img.width and height < img.height:
+        img.draft(None, (width, height))
+    if img.width * img.height > MAX_DECODE_PIXELS:
+        size = img.size
+        img.close()
+        raise ValueError(f"图片过大（{size[0]}x{size[1]}），超过解码像素上限 {MAX_DECODE_PIXELS}")
+    return img
+
+
+class TilePyramid:
+    """多分辨率瓦片金字塔
+
+    第 k 层为原图的 1/2^k，切成 TILE_SIZE 见方的瓦片写入临时目录。
+    后台线程先生成预览图，再从最粗的一层开始构建，构建完成的层记录在 ready_levels 中。
+    任何一次解码都不超过 MAX_DECODE_PIXELS：JPEG 只构建按 draft 缩小解码后不超过预算的层
+    （min_level 以下的层不生成，放大时由 min_level 层放大显示），其他格式超过预算时无法打开。
+    """
+
+    TILE_SIZE = 256
+
+    def __init__(self, image_path):
+        self.image_path = image_path
+        with Image.open(image_path) as img:
+            self.width, self.height = img.size
+            self.supports_draft = img.format == "JPEG"
+
+        self.max_level = 0
+        while max(self.width, self.height) / (2 ** self.max_level) > self.TILE_SIZE:
+            self.max_level += 1
+
+        self.min_level = 0
+        while (self.min_level < self.max_level
+               and self.decoded_pixels(self.level_size(self.min_level)) > MAX_DECODE_PIXELS):
+            self.min_level += 1
+        if self.decoded_pixels(self.level_size(self.min_level)) > MAX_DECODE_PIXELS:
+            raise ValueError(f"图片过大（{self.width}x{self.height}），超过解码像素上限 {MAX_DECODE_PIXELS}")
+
+        self.tile_dir = tempfile.mkdtemp(prefix="mistake_tiles_")
+        self.preview = None
+        self.ready_levels = set()
+        self.error = None
+        self.cancelled = threading.Event()
+        self.thread = None
+
+    def decoded_pixels(self, target_size):
+        """按 open_reduced 的规则，解码到目标尺寸时实际需要解码的像素数"""
+        if not self.supports_draft:
+            return self.width * self.height
+        ratio = min(self.width // max(1, target_size[0]), self.height // max(1, target_size[1]))
+        scale = next((s for s in (8, 4, 2) if ratio >= s), 1)
+        return -(-self.width // scale) * -(-self.height // scale)
+
+    def level_size(self, level):
+        scale = 2 ** level
+        return max(1, -(-self.width // scale)), max(1, -(-self.height // scale))
+
+    def tile_count(self, level):
+        width, height = self.level_size(level)
+        return -(-width // self.TILE_SIZE), -(-height // self.TILE_SIZE)
+
+    def tile_path(self, level, tx, ty):
+        return os.path.join(self.tile_dir, f"{level}_{tx}_{ty}.png")
+
+    def preview_size(self, max_width, max_height):
+        scale = min(max_width / self.width, max_height / self.height, 1)
+        return max(1, int(self.width * scale)), max(1, int(self.height * scale))
+
+    def start(self, max_width, max_height):
+        """在后台线程中生成适应视口的预览图并构建金字塔"""
+        self.thread = threading.Thread(target=self._build, args=(max_width, max_height), daemon=True)
+        self.thread.start()
+
+    def _build(self, max_width, max_height):
+        try:
+            preview_size = self.preview_size(max_width, max_height)
+            if self.supports_draft:
+                # 预览图和各层都按比例缩小解码，从粗到细逐层构建，先出现的是粗略视图
+                self.preview = self._decode(preview_size)
+                for level in range(self.max_level, self.min_level - 1, -1):
+                    if self.cancelled.is_set():
+                        return
+                    size = self.level_size(level)
+                    img = self._decode(size)
+                    self._cut_tiles(img, level)
+                    img.close()
+                    self.ready_levels.add(level)
+            else:
+                # 其他格式无法缩小解码：只解码一次（不超过预算），再逐层缩小，内存中同时只保留一层
+                img = self._normalize_mode(open_reduced(self.image_path, (self.width, self.height)))
+                self.preview = img.resize(preview_size, Image.LANCZOS)
+                for level in range(self.max_level + 1):
+                    if self.cancelled.is_set():
+                        return
+                    size = self.level_size(level)
+                    if img.size != size:
+                        img = img.resize(size, Image.BOX)
+                    self._cut_tiles(img, level)
+                    self.ready_levels.add(level)
+                img.close()
+        except Exception as e:
+            self.error = e
+
+    def _decode(self, size):
+        img = self._normalize_mode(open_reduced(self.image_path, size))
+        if img.size != size:
+            img = img.resize(size, Image.LANCZOS)
+        return img
+
+    def _cut_tiles(self, img, level):
+        size = img.size
+        cols, rows = self.tile_count(level)
+        for ty in range(rows):
+            for tx in range(cols):
+                if self.cancelled.is_set():
+                    return
+                box = (tx * self.TILE_SIZE, ty * self.TILE_SIZE,
+                       min((tx + 1) * self.TILE_SIZE, size[0]),
+                       min((ty + 1) * self.TILE_SIZE, size[1]))
+                img.crop(box).save(self.tile_path(level, tx, ty), compress_level=1)
+
+    @staticmethod
+    def _normalize_mode(img):
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        return img
+
+    def close(self):
+        self.cancelled.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        shutil.rmtree(self.tile_dir, ignore_errors=True)
+
+
+class ImageZoomViewer:
+    """可缩放、拖动的图片查看窗口，只渲染视口内可见的瓦片"""
+
+    MIN_SCALE = 0.02
+    MAX_SCALE = 8.0
+
+    def __init__(self, parent, image_path, cache, title="查看图片"):
+        self.cache = cache
+        # 先读取图片信息，文件损坏或不支持时直接抛出异常，不会留下空窗口
+        self.pyramid = TilePyramid(image_path)
+
+        self.window = tk.Toplevel(parent)
+        self.window.title(title)
+        self.window.geometry("900x680")
+        self.window.configure(bg='#f5f7fa')
+
+        toolbar = ttk.Frame(self.window)
+        toolbar.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
+        ttk.Button(toolbar, text="放大", command=lambda: self.zoom(1.25), width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="缩小", command=lambda: self.zoom(0.8), width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="适应窗口", command=self.fit_to_window, width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="原始大小", command=self.actual_size, width=8).pack(side=tk.LEFT, padx=5)
+        self.zoom_label = ttk.Label(toolbar, text="")
+        self.zoom_label.pack(side=tk.RIGHT, padx=5)
+
+        self.canvas = tk.Canvas(self.window, bg="#333333", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        # 视口状态：scale 为屏幕像素 / 原图像素，view_x / view_y 为视口左上角对应的原图坐标
+        self.scale = None
+        self.view_x = 0.0
+        self.view_y = 0.0
+        self.drag_start = None
+        self.closed = False
+
+        self.preview = None
+        self.preview_photo = None
+        self.canvas_images = []
+        # 当前显示的瓦片对应的 PhotoImage，拖动时直接复用，不再重复创建
+        self.tile_photos = {}
+        self.known_levels = set()
+
+        self.canvas.bind("<Configure>", self.on_configure)
+        self.canvas.bind("<ButtonPress-1>", self.on_drag_start)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+        self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+        self.canvas.bind("<Button-4>", lambda e: self.on_mousewheel(e, 120))
+        self.canvas.bind("<Button-5>", lambda e: self.on_mousewheel(e, -120))
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.poll_job = self.window.after(200, self.poll_pyramid)
+
+    def viewport_size(self):
+        return max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+
+    def on_configure(self, event=None):
+        if self.scale is None:
+            width, height = self.viewport_size()
+            if width <= 1 or height <= 1:
+                return
+            self.pyramid.start(width, height)
+            self.fit_to_window()
+        else:
+            self.render()
+
+    def fit_to_window(self):
+        width, height = self.viewport_size()
+        self.scale = min(width / self.pyramid.width, height / self.pyramid.height, 1)
+        self.view_x = (self.pyramid.width - width / self.scale) / 2
+        self.view_y = (self.pyramid.height - height / self.scale) / 2
+        self.render()
+
+    def actual_size(self):
+        self.set_scale(1.0)
+
+    def zoom(self, factor, anchor=None):
+        if self.scale is None:
+            return
+        self.set_scale(self.scale * factor, anchor)
+
+    def set_scale(self, scale, anchor=None):
+        if self.scale is None:
+            return
+        width, height = self.viewport_size()
+        if anchor is None:
+            anchor = (width / 2, height / 2)
+        scale = min(max(scale, self.MIN_SCALE), self.MAX_SCALE)
+
+        # 保持锚点下的原图位置不变
+        src_x = self.view_x + anchor[0] / self.scale
+        src_y = self.view_y + anchor[1] / self.scale
+        self.scale = scale
+        self.view_x = src_x - anchor[0] / scale
+        self.view_y = src_y - anchor[1] / scale
+        self.render()
+
+    def on_drag_start(self, event):
+        self.drag_start = (event.x, event.y, self.view_x, self.view_y)
+
+    def on_drag(self, event):
+        if self.drag_start is None or self.scale is None:
+            return
+        x0, y0, view_x, view_y = self.drag_start
+        self.view_x = view_x - (event.x - x0) / self.scale
+        self.view_y = view_y - (event.y - y0) / self.scale
+        self.render()
+
+    def on_mousewheel(self, event, delta=None):
+        delta = event.delta if delta is None else delta
+        self.zoom(1.25 if delta > 0 else 0.8, (event.x, event.y))
+        return "break"
+
+    def poll_pyramid(self):
+        self.poll_job = None
+        if self.pyramid.error is not None:
+            self.zoom_label.configure(text=f"图片加载错误: {self.pyramid.error}")
+            return
+        changed = False
+        if self.preview is None and self.pyramid.preview is not None:
+            self.preview = self.pyramid.preview
+            changed = True
+        if self.pyramid.ready_levels != self.known_levels:
+            self.known_levels = set(self.pyramid.ready_levels)
+            changed = True
+        if changed:
+            self.render()
+        if len(self.known_levels) <= self.pyramid.max_level - self.pyramid.min_level:
+            self.poll_job = self.window.after(200, self.poll_pyramid)
+
+    def choose_level(self):
+        """选择分辨率不低于当前缩放比例的最粗一层（不细于已构建的最细一层）"""
+        level = self.pyramid.min_level
+        while level < self.pyramid.max_level and self.scale * (2 ** (level + 1)) <= 1:
+            level += 1
+        return level
+
+    def render(self):
+        if self.scale is None:
+            return
+        self.canvas.delete("all")
+        self.canvas_images = []
+        self.zoom_label.configure(text=f"{self.scale * 100:.0f}%")
+
+        level = self.choose_level()
+        if level in self.known_levels:
+            self.render_tiles(level)
+        else:
+            self.tile_photos = {}
+            self.render_preview()
+
+    def render_preview(self):
+        if self.preview is None:
+            return
+        width, height = self.viewport_size()
+        ratio = self.preview.width / self.pyramid.width
+        left = max(self.view_x, 0)
+        top = max(self.view_y, 0)
+        right = min(self.view_x + width / self.scale, self.pyramid.width)
+        bottom = min(self.view_y + height / self.scale, self.pyramid.height)
+        if right <= left or bottom <= top:
+            return
+
+        crop = self.preview.crop((int(left * ratio), int(top * ratio),
+                                  max(int(left * ratio) + 1, int(right * ratio)),
+                                  max(int(top * ratio) + 1, int(bottom * ratio))))
+        size = (max(1, int((right - left) * self.scale)), max(1, int((bottom - top) * self.scale)))
+        self.preview_photo = ImageTk.PhotoImage(crop.resize(size, Image.BILINEAR))
+        self.canvas.create_image((left - self.view_x) * self.scale, (top - self.view_y) * self.scale,
+                                 image=self.preview_photo, anchor=tk.NW)
+
+    def render_tiles(self, level):
+        width, height = self.viewport_size()
+        tile_size = self.pyramid.TILE_SIZE
+        level_scale = 2 ** level
+        # 该层一个像素在屏幕上的大小
+        display = self.scale * level_scale
+
+        cols, rows = self.pyramid.tile_count(level)
+        level_left = self.view_x / level_scale
+        level_top = self.view_y / level_scale
+        first_tx = max(0, int(level_left // tile_size))
+        first_ty = max(0, int(level_top // tile_size))
+        last_tx = min(cols - 1, int((level_left + width / display) // tile_size))
+        last_ty = min(rows - 1, int((level_top + height / display) // tile_size))
+
+        offset_x = round(level_left * display)
+        offset_y = round(level_top * display)
+        shown = {}
+        for ty in range(first_ty, last_ty + 1):
+            for tx in range(first_tx, last_tx + 1):
+                key = (self.pyramid.tile_dir, level, tx, ty, round(display, 4))
+                photo = self.tile_photos.get(key) or self.get_tile_photo(key, display)
+                if photo is None:
+                    continue
+                shown[key] = photo
+                x = round(tx * tile_size * display) - offset_x
+                y = round(ty * tile_size * display) - offset_y
+                self.canvas.create_image(x, y, image=photo, anchor=tk.NW)
+                self.canvas_images.append(photo)
+        # 只保留当前可见瓦片的 PhotoImage
+        self.tile_photos = shown
+
+    def get_tile_photo(self, key, display):
+        # 缓存缩放后的瓦片（PIL 图片），PhotoImage 只在界面线程中按需创建
+        _, level, tx, ty, _ = key
+        tile = self.cache.get("tiles", key)
+        if tile is None:
+            try:
+                tile = self.load_tile(level, tx, ty, display)
+            except OSError:
+                return None
+            self.cache.put("tiles", key, tile)
+        return ImageTk.PhotoImage(tile)
+
+    def load_tile(self, level, tx, ty, display):
+        with Image.open(self.pyramid.tile_path(level, tx, ty)) as tile:
+            tile.load()
+            size = tile.size
+            # 相邻瓦片按累计坐标取整，避免缩放后出现缝隙
+            x0 = round(tx * self.pyramid.TILE_SIZE * display)
+            y0 = round(ty * self.pyramid.TILE_SIZE * display)
+            x1 = round((tx * self.pyramid.TILE_SIZE + size[0]) * display)
+            y1 = round((ty * self.pyramid.TILE_SIZE + size[1]) * display)
+            target = (max(1, x1 - x0), max(1, y1 - y0))
+            if target != size:
+                return tile.resize(target, Image.LANCZOS if display < 1 else Image.NEAREST)
+            return tile.copy()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.poll_job is not None:
+            self.window.after_cancel(self.poll_job)
+            self.poll_job = None
+        tile_dir = self.pyramid.tile_dir
+        self.cache.invalidate("tiles", match=lambda key: key[0] == tile_dir)
+        self.canvas_images = []
+        self.tile_photos = {}
+        self.pyramid.close()
+        self.window.destroy()
+
+
+WORKSHEET_STYLE = """
+body { font-family: "Noto Sans CJK SC", "Source Han Sans SC", "Microsoft YaHei", sans-serif; color: #333333; margin: 2em; }
+h1 { color: #1a73e8; border-bottom: 2px solid #1a73e8; padding-bottom: 0.3em; }
+h2 { color: #1a73e8; }
+.meta { color: #888888; font-size: 0.9em; }
+.item { margin-bottom: 1.5em; page-break-inside: avoid; }
+.item h3 { margin: 0.2em 0; }
+.text { white-space: pre-wrap; line-height: 1.6; }
+.item img { display: block; max-width: 100%; margin: 0.5em 0; }
+.blank { height: 6em; border-bottom: 1px dashed #cccccc; }
+.missing { color: #d93025; border: 1px dashed #d93025; padding: 0.5em; margin: 0.5em 0; font-size: 0.9em; }
+.answers { page-break-before: always; }
+"""
+
+
+def _scale_sheet_image(task):
+    """缩放一张图片并编码为 data URI，在进程池中执行
+
+    返回 (data_uri, None)；图片不存在或无法解码时返回 (None, 错误信息)。
+    """
+    image_path, max_width = task
+    try:
+        with Image.open(image_path) as img:
+            size = img.size
+        if size[0] > max_width:
+            size = (max_width, max(1, int(size[1] * max_width / size[0])))
+        with open_reduced(image_path, size) as img:
+            if img.size != size:
+                img = img.resize(size, Image.LANCZOS)
+            if "A" in img.getbands() or img.mode == "P":
+                img = img.convert("RGBA")
+                fmt, mime = "PNG", "image/png"
+            else:
+                img = img.convert("RGB")
+                fmt, mime = "JPEG", "image/jpeg"
+            buffer = io.BytesIO()
+            img.save(buffer, fmt, quality=85)
+        return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}", None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+def generate_worksheet(mistakes, output_path, title="错题练习卷", include_answers=True,
+                       pdf_path=None, max_image_width=640, workers=None, chunk_size=32):
+    """生成自包含的 HTML 练习卷（图片以 data URI 内嵌），可选同时导出 PDF
+
+    图片缩放在进程池中并行执行；按批次处理并边处理边写入文件，内存占用与题目数量无关。
+    无法加载的图片在练习卷中显示为提示框。返回 (写入的题目数量, 无法加载的图片数量)。
+    """
+    if pdf_path and WeasyHTML is None:
+        raise RuntimeError("未安装 weasyprint，无法生成 PDF（可用浏览器打开 HTML 后打印为 PDF）")
+
+    mistakes = list(mistakes)
+    failed_images = 0
+    has_images = any(m.get('images') for m in mistakes)
+    executor = ProcessPoolExecutor(max_workers=workers) if has_images else None
+
+    try:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write("<!DOCTYPE html>\n<html lang=\"zh-CN\">\n<head>\n<meta charset=\"utf-8\">\n")
+            f.write(f"<title>{html.escape(title)}</title>\n<style>{WORKSHEET_STYLE}</style>\n</head>\n<body>\n")
+            f.write(f"<h1>{html.escape(title)}</h1>\n")
+            f.write(f"<p class=\"meta\">共 {len(mistakes)} 题 · 生成时间 "
+                    f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}</p>\n")
+
+            def submit(start):
+                chunk = mistakes[start:start + chunk_size]
+                futures = [[(path, executor.submit(_scale_sheet_image, (path, max_image_width)))
+                            for path in m.get('images', [])] for m in chunk]
+                return chunk, futures
+
+            # 流水线：写入当前批次的同时，后面的批次已在进程池中缩放图片
+            starts = list(range(0, len(mistakes), chunk_size))
+            pending = [submit(start) for start in starts[:2]] if executor else []
+
+            for i, start in enumerate(starts):
+                if executor:
+                    chunk, futures = pending.pop(0)
+                    if i + 2 < len(starts):
+                        pending.append(submit(starts[i + 2]))
+                else:
+                    chunk = mistakes[start:start + chunk_size]
+                    futures = [[] for _ in chunk]
+
+                for number, (mistake, image_futures) in enumerate(zip(chunk, futures), start + 1):
+                    f.write("<div class=\"item\">\n")
+                    f.write(f"<h3>{number}. {html.escape(mistake.get('title', ''))}</h3>\n")
+                    f.write(f"<p class=\"meta\">{html.escape(mistake.get('subject', ''))} / "
+                            f"{html.escape(mistake.get('chapter', ''))} · {html.escape(mistake.get('date', ''))}</p>\n")
+                    f.write(f"<div class=\"text\">{html.escape(mistake.get('description', ''))}</div>\n")
+                    for path, future in image_futures:
+                        data_uri, error = future.result()
+                        if data_uri:
+                            f.write(f"<img src=\"{data_uri}\" alt=\"\">\n")
+                        else:
+                            failed_images += 1
+                            f.write(f"<div class=\"missing\">图片无法加载: "
+                                    f"{html.escape(os.path.basename(path))}（{html.escape(error)}）</div>\n")
+                    f.write("<div class=\"blank\"></div>\n</div>\n")
+
+            if include_answers:
+                f.write("<div class=\"answers\">\n<h2>参考答案</h2>\n")
+                for number, mistake in enumerate(mistakes, 1):
+                    answer = mistake.get('answer', '') or "（暂无答案）"
+                    f.write(f"<div class=\"item\">\n<h3>{number}. {html.escape(mistake.get('title', ''))}</h3>\n")
+                    f.write(f"<div class=\"text\">{html.escape(answer)}</div>\n</div>\n")
+                f.write("</div>\n")
+
+            f.write("</body>\n</html>\n")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if pdf_path:
+        WeasyHTML(filename=output_path).write_pdf(pdf_path)
+
+    return len(mistakes), failed_images
+
+
+class MistakeRequestHandler(BaseHTTPRequestHandler):
+    """只读 JSON / 图片接口
+
+    GET /api/tree                              学科与章节树（含每章错题数）
+    GET /api/mistakes?subject=&chapter=&page=  分页错题列表
+    GET /api/mistakes/<id>                     错题详情
+    GET /api/mistakes/<id>/images/<n>          原图，?size=thumb 返回缩略图
+
+    HEAD 与 GET 相同但不返回正文。出错时返回 JSON：找不到为 404，参数错误为 400，
+    图片无法读取等服务端错误为 500。
+    """
+
+    server_version = "MistakeNotebook/2.2"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # 图形界面程序不向终端输出访问日志
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        try:
+            if parts == ['api', 'tree']:
+                self.send_cached(self.path, lambda: self.server.build_tree())
+            elif parts == ['api', 'mistakes']:
+                self.send_cached(self.path, lambda: self.server.build_list(query))
+            elif len(parts) == 3 and parts[:2] == ['api', 'mistakes']:
+                self.send_cached(self.path, lambda: self.server.build_detail(parts[2]))
+            elif len(parts) == 5 and parts[:2] == ['api', 'mistakes'] and parts[3] == 'images':
+                self.send_image(parts[2], parts[4], query.get('size') == 'thumb')
+            elif not parts:
+                self.send_cached(self.path, lambda: self.server.build_index())
+            else:
+                self.send_error(404, "Not Found")
+        except ConnectionError:
+            # 客户端已断开，无法再发送响应
+            self.close_connection = True
+        except (LookupError, FileNotFoundError) as e:
+            self.send_json_error(404, str(e))
+        except ValueError as e:
+            self.send_json_error(400, str(e))
+        except Exception as e:
+            # 图片损坏或不支持（UnidentifiedImageError）、文件读取失败等
+            self.send_json_error(500, str(e))
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def send_cached(self, key, build, content_type="application/json; charset=utf-8", region="http"):
+        generation = self.server.cache.generation(region)
+        entry = self.server.get_cached(region, key)
+        if entry is None:
+            body = build()
+            if not isinstance(body, bytes):
+                body = _json_encode(body)
+            entry = self.server.put_cached(region, key, content_type, body, generation)
+        self.send_entry(*entry)
+
+    def send_entry(self, etag, content_type, body):
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_json_error(self, code, message):
+        body = json.dumps({"error": message}, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_image(self, mistake_id, index, thumbnail):
+        image_path = self.server.image_path(mistake_id, index)
+        stat = os.stat(image_path)
+        kind = "thumb" if thumbnail else "full"
+        key = f"image:{kind}:{image_path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+        if thumbnail:
+            # 缩略图的键包含文件修改时间，数据变更时不需要失效
+            self.send_cached(key, lambda: self.server.build_thumbnail(image_path), "image/jpeg", "thumbnails")
+            return
+
+        # 原图不进内存缓存，ETag 由修改时间和大小生成
+        etag = '"' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '"'
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_entry(etag, None, b'')
+            return
+
+        content_type = {
+            ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg",
+            ".gif": "image/gif", ".bmp": "image/bmp"
+        }.get(os.path.splitext(image_path)[1].lower(), "application/octet-stream")
+
+        with open(image_path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(stat.st_size))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            if self.command != 'HEAD':
+                try:
+                    shutil.copyfileobj(f, self.wfile)
+                except OSError:
+                    # 响应头已发出，只能断开连接
+                    self.close_connection = True
+
+
+class MistakeHTTPServer(ThreadingHTTPServer):
+    """在局域网内只读共享错题本，响应缓存在程序的缓存管理器 http 区域中，数据写入时失效"""
+
+    daemon_threads = True
+    request_queue_size = 64
+    THUMBNAIL_SIZE = (240, 240)
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 200
+
+    def __init__(self, app, host="0.0.0.0", port=8765):
+        super().__init__((host, port), MistakeRequestHandler)
+        self.app = app
+        self.cache = app.cache
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def get_cached(self, region, key):
+        return self.cache.get(region, key)
+
+    def put_cached(self, region, key, content_type, body, generation=None):
+        """缓存响应；generation 为开始生成时的缓存代数，期间数据有变化则不写入缓存"""
+        entry = ('"' + hashlib.sha1(body).hexdigest()[:16] + '"', content_type, body)
+        return self.cache.put(region, key, entry, len(body) + 128, generation)
+
+    def find_mistake(self, mistake_id):
+        mistake = self.app.find_mistake(mistake_id)
+        if mistake is None:
+            raise LookupError(f"错题不存在: {mistake_id}")
+        return mistake
+
+    def summary(self, mistake):
+        return {
+            "id": mistake.get('id'),
+            "title": mistake.get('title', ''),
+            "subject": mistake.get('subject', ''),
+            "chapter": mistake.get('chapter', ''),
+            "date": mistake.get('date', ''),
+            "image_count": len(mistake.get('images', [])),
+        }
+
+    def build_index(self):
+        return {"endpoints": ["/api/tree", "/api/mistakes", "/api/mistakes/<id>", "/api/mistakes/<id>/images/<n>"]}
+
+    def build_tree(self):
+        counts = {}
+        for mistake in list(self.app.mistakes):
+            key = (mistake.get('subject'), mistake.get('chapter'))
+            counts[key] = counts.get(key, 0) + 1
+
+        return {"subjects": [
+            {"name": subject,
+             "chapters": [{"name": chapter, "count": counts.get((subject, chapter), 0)}
+                          for chapter in self.app.chapters.get(subject, [])]}
+            for subject in list(self.app.subjects)
+        ]}
+
+    def build_list(self, query):
+        criteria = {"sort_by": "date", "reverse": True}
+        if query.get('subject'):
+            criteria["subjects"] = [query['subject']]
+            if query.get('chapter'):
+                criteria["chapters"] = [(query['subject'], query['chapter'])]
+        if query.get('date_from'):
+            criteria["date_from"] = query['date_from']
+        if query.get('date_to'):
+            criteria["date_to"] = query['date_to']
+
+        try:
+            page = max(1, int(query.get('page', 1)))
+            per_page = min(self.MAX_PAGE_SIZE, max(1, int(query.get('per_page', self.DEFAULT_PAGE_SIZE))))
+        except ValueError:
+            raise ValueError("page 和 per_page 必须是整数")
+
+        results = self.app.query_mistakes(**criteria)
+        start = (page - 1) * per_page
+        return {
+            "total": len(results),
+            "page": page,
+            "per_page": per_page,
+            "items": [self.summary(m) for m in results[start:start + per_page]],
+        }
+
+    def build_detail(self, mistake_id):
+        mistake = self.find_mistake(mistake_id)
+        detail = self.summary(mistake)
+        detail["description"] = mistake.get('description', '')
+        detail["answer"] = mistake.get('answer', '')
+        base = f"/api/mistakes/{quote(mistake_id)}/images"
+        detail["images"] = [{"url": f"{base}/{i}", "thumbnail": f"{base}/{i}?size=thumb"}
+                            for i in range(len(mistake.get('images', [])))]
+        return detail
+
+    def image_path(self, mistake_id, index):
+        images = self.find_mistake(mistake_id).get('images', [])
+        try:
+            image_path = images[int(index)]
+        except (ValueError, IndexError):
+            raise LookupError(f"图片不存在: {index}")
+        if not os.path.exists(image_path):
+            raise LookupError(f"图片不存在: {index}")
+        return image_path
+
+    def build_thumbnail(self, image_path):
+        with open_reduced(image_path, self.THUMBNAIL_SIZE) as img:
+            img.thumbnail(self.THUMBNAIL_SIZE, Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.convert("RGB").save(buffer, "JPEG", quality=80)
+        return buffer.getvalue()
+
+
+class DataDirLock:
+    """数据目录的跨进程独占锁，防止两个实例同时写入同一份数据"""
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, ".lock")
+        self.file = None
+
+    def acquire(self):
+        lock_file = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self.file = lock_file
+        return True
+
+    def release(self):
+        if self.file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        self.file.close()
+        self.file = None
+
+
+def file_signature(path):
+    """文件的 (修改时间, 大小)，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DataDirWatcher:
+    """监视数据目录中的数据文件，发现变化时以文件名集合调用 callback（在监视线程中调用）
+
+    Linux 下通过 ctypes 使用 inotify，其他平台或 inotify 不可用时定时轮询文件状态。
+    """
+
+    WATCHED_FILES = ("subjects.json", "chapters.json", "mistakes.json")
+    POLL_INTERVAL = 1.0
+    SETTLE_DELAY = 0.1
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+
+    def __init__(self, data_dir, callback):
+        self.data_dir = data_dir
+        self.callback = callback
+        self.stopped = threading.Event()
+        self.thread = None
+        self.mode = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        fd = self._open_inotify()
+        if fd is None:
+            self.mode = "polling"
+            self._run_polling()
+        else:
+            self.mode = "inotify"
+            try:
+                self._run_inotify(fd)
+            finally:
+                os.close(fd)
+
+    def _open_inotify(self):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(os.path.abspath(self.data_dir)), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _read_events(self, fd):
+        names = set()
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + 16 <= len(data):
+            _, _, _, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0").decode('utf-8', 'replace')
+            if name in self.WATCHED_FILES:
+                names.add(name)
+            offset += 16 + length
+        return names
+
+    def _run_inotify(self, fd):
+        while not self.stopped.is_set():
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if not ready:
+                continue
+            names = self._read_events(fd)
+            # 合并短时间内的连续事件（例如先写临时文件再改名）
+            time.sleep(self.SETTLE_DELAY)
+            names |= self._read_events(fd)
+            if names:
+                self.callback(names)
+
+    def _run_polling(self):
+        signatures = {name: file_signature(os.path.join(self.data_dir, name)) for name in self.WATCHED_FILES}
+        while not self.stopped.wait(self.POLL_INTERVAL):
+            names = set()
+            for name in self.WATCHED_FILES:
+                signature = file_signature(os.path.join(self.data_dir, name))
+                if signature != signatures[name]:
+                    signatures[name] = signature
+                    names.add(name)
+            if names:
+                self.callback(names)
+
 
 class EnhancedMistakeManager:
-    def __init__(self, root):
+    # 数据变更时需要失效的缓存区域
+    DATA_CACHE_REGIONS = ("records", "lists", "search", "http")
+
+    def __init__(self, root, cache_bytes=64 * 1024 * 1024, codec=None, compression=None):
         self.root = root
         self.root.title("学霸错题本 - 高效学习助手（本软件为免费软件，如果你是付费获得的，那证明你被骗了awa）")
         self.root.geometry("1100x700")
@@ -30,6 +1456,27 @@ class EnhancedMistakeManager:
         if not os.path.exists(self.image_dir):
             os.makedirs(self.image_dir)
 
+        # 数据目录加锁：已有实例在使用时只能以只读模式打开
+        self.read_only = False
+        self.data_lock = DataDirLock(self.data_dir)
+        if not self.data_lock.acquire():
+            if not messagebox.askyesno("错题本已打开",
+                                       "另一个错题本窗口正在使用该数据目录。\n是否以只读模式打开？",
+                                       parent=self.root):
+                self.root.destroy()
+                sys.exit(0)
+            self.read_only = True
+            self.root.title(self.root.title() + " [只读]")
+
+        # 记录数据文件的状态，用于区分自己的写入和外部修改
+        self.file_signatures = {}
+
+        # 数据文件的编码和压缩方式（见 STORAGE_CODECS / STORAGE_COMPRESSIONS）
+        # 为 None 时保存沿用加载时检测到的格式，新文件使用默认格式
+        self.storage_codec = codec
+        self.storage_compression = compression
+        self.file_formats = {}
+
         # 加载字体
         self.load_fonts()
 
@@ -38,6 +1485,29 @@ class EnhancedMistakeManager:
         self.chapters = self.load_chapters()
         self.mistakes = self.load_mistakes()
 
+        # 统一缓存：图片、列表、查询结果、共享服务响应；数据区域失效时同时丢弃二级索引
+        self.cache = CacheManager(cache_bytes)
+        self.cache.add_invalidation_hook(self.on_cache_invalidated)
+
+        # 二级索引（数据变更后按需重建）
+        self.mistake_index = None
+        self.data_generation = 0
+        self.index_lock = threading.Lock()
+
+        # 局域网共享服务
+        self.http_server = None
+
+        # 打开的图片查看窗口，主窗口关闭时一并关闭并清理瓦片临时目录
+        self.image_viewers = []
+
+        # 错题 ID 生成器，并把旧格式或重复的 ID 迁移为新格式
+        self.id_generator = MonotonicIdGenerator()
+        self.migrate_mistake_ids()
+
+        # 列表框中当前显示的错题记录（章节列表或筛选结果），与列表行一一对应
+        self.listed_mistakes = []
+        self.active_filter = None
+
         # 当前选择的错题
         self.current_mistake = None
         self.current_image_index = 0
@@ -49,6 +1519,12 @@ class EnhancedMistakeManager:
         self.update_subject_dropdown()
         self.update_chapter_dropdown()
 
+        # 监视数据目录，合并其他程序或其他实例的修改
+        self.watcher = DataDirWatcher(self.data_dir, self.on_files_changed)
+        self.watcher.start()
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
     def load_fonts(self):
         """加载字体"""
         self.default_font = ("DejaVu Sans", 10)
@@ -111,6 +1587,11 @@ class EnhancedMistakeManager:
         ttk.Button(btn_frame2, text="添加章节", command=self.add_chapter, width=10).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(btn_frame2, text="删除章节", command=self.delete_chapter, width=10).pack(side=tk.LEFT)
 
+        btn_frame3 = ttk.Frame(subject_frame)
+        btn_frame3.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(btn_frame3, text="高级筛选", command=self.show_filter_panel, width=10).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(btn_frame3, text="清除筛选", command=self.clear_filter, width=10).pack(side=tk.LEFT)
+
         ttk.Separator(left_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
 
         # 错题列表
@@ -236,6 +1717,7 @@ class EnhancedMistakeManager:
 
         self.image_label = ttk.Label(img_display_frame)
         self.image_label.pack(fill=tk.BOTH, expand=True)
+        self.image_label.bind("<Double-Button-1>", lambda e: self.open_image_viewer())
 
         # 图片导航
         nav_frame = ttk.Frame(image_frame)
@@ -248,6 +1730,7 @@ class EnhancedMistakeManager:
         ttk.Button(nav_frame, text="下一张", command=self.next_image, width=8).pack(side=tk.LEFT, padx=5)
         ttk.Button(nav_frame, text="添加图片", command=self.upload_image, width=8).pack(side=tk.LEFT, padx=5)
         ttk.Button(nav_frame, text="删除图片", command=self.delete_image, width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(nav_frame, text="放大查看", command=self.open_image_viewer, width=8).pack(side=tk.LEFT, padx=5)
 
         # 底部按钮区域
         button_frame = ttk.Frame(scrollable_frame)
@@ -261,6 +1744,9 @@ class EnhancedMistakeManager:
 
         ttk.Button(button_frame, text="导出数据", command=self.export_data).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="导入数据", command=self.import_data).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="生成练习卷", command=self.show_worksheet_dialog).pack(side=tk.LEFT, padx=5)
+        self.share_button = ttk.Button(button_frame, text="共享服务", command=self.toggle_http_server)
+        self.share_button.pack(side=tk.LEFT, padx=5)
 
         ttk.Separator(button_frame, orient=tk.VERTICAL).pack(side=tk.LEFT, padx=10, fill=tk.Y)
 
@@ -286,6 +1772,9 @@ class EnhancedMistakeManager:
         # 绑定鼠标滚轮事件实现滚动
         canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1*(e.delta/120)), "units"))
 
+        # F12 打开缓存统计面板
+        self.root.bind("<F12>", lambda e: self.show_cache_panel())
+
     def setup_styles(self):
         # 创建自定义样式
         style = ttk.Style()
@@ -325,20 +1814,19 @@ class EnhancedMistakeManager:
     def load_subjects(self):
         file_path = os.path.join(self.data_dir, "subjects.json")
         if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.read_storage_file("subjects.json")
         return ["数学", "物理", "化学", "生物", "英语", "语文"]
 
     def save_subjects(self):
-        file_path = os.path.join(self.data_dir, "subjects.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.subjects, f, ensure_ascii=False)
+        if self.read_only:
+            return
+        self.write_storage_file("subjects.json", self.subjects)
+        self.data_changed()
 
     def load_chapters(self):
         file_path = os.path.join(self.data_dir, "chapters.json")
         if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.read_storage_file("chapters.json")
         return {
             "数学": ["代数", "几何", "函数", "概率统计"],
             "物理": ["力学", "电磁学", "光学", "热学"],
@@ -349,29 +1837,176 @@ class EnhancedMistakeManager:
         }
 
     def save_chapters(self):
-        file_path = os.path.join(self.data_dir, "chapters.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.chapters, f, ensure_ascii=False)
+        if self.read_only:
+            return
+        self.write_storage_file("chapters.json", self.chapters)
+        self.data_changed()
 
     def load_mistakes(self):
         file_path = os.path.join(self.data_dir, "mistakes.json")
         if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                for mistake in data:
-                    if "images" not in mistake:
-                        if "image" in mistake:
-                            mistake["images"] = [mistake["image"]]
-                            del mistake["image"]
-                        else:
-                            mistake["images"] = []
-                return data
+            data = self.read_storage_file("mistakes.json")
+            for mistake in data:
+                if "images" not in mistake:
+                    if "image" in mistake:
+                        mistake["images"] = [mistake["image"]]
+                        del mistake["image"]
+                    else:
+                        mistake["images"] = []
+            return data
         return []
 
     def save_mistakes(self):
-        file_path = os.path.join(self.data_dir, "mistakes.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.mistakes, f, ensure_ascii=False, indent=2)
+        if self.read_only:
+            return
+        self.write_storage_file("mistakes.json", self.mistakes)
+        self.data_changed()
+
+    def storage_format(self, name):
+        """保存 name 时使用的 (编码, 压缩)：命令行指定的优先，否则沿用加载时检测到的格式"""
+        codec, compression = self.file_formats.get(name) or (STORAGE_CODEC, STORAGE_COMPRESSION)
+        return self.storage_codec or codec, self.storage_compression or compression
+
+    def read_storage_file(self, name):
+        self.remember_file_signature(name)
+        data, data_format = read_data_file(os.path.join(self.data_dir, name), with_format=True)
+        self.file_formats[name] = data_format
+        return data
+
+    def write_storage_file(self, name, obj):
+        write_data_file(os.path.join(self.data_dir, name), obj, *self.storage_format(name))
+        self.remember_file_signature(name)
+
+    def remember_file_signature(self, name):
+        self.file_signatures[name] = file_signature(os.path.join(self.data_dir, name))
+
+    def on_files_changed(self, names):
+        # 监视线程回调，转到界面线程处理
+        self.root.after(0, self.apply_external_changes, names)
+
+    def apply_external_changes(self, names, refresh_detail=True):
+        """把外部修改按记录 id 增量合并到内存数据和界面"""
+        changed = []
+        for name in names:
+            signature = file_signature(os.path.join(self.data_dir, name))
+            if signature == self.file_signatures.get(name):
+                continue
+            if signature is None:
+                # 文件被删除时保留内存中的数据，下次保存会重新写出
+                self.file_signatures[name] = None
+                continue
+            changed.append(name)
+        if not changed:
+            return
+
+        try:
+            subjects = self.load_subjects() if "subjects.json" in changed else None
+            chapters = self.load_chapters() if "chapters.json" in changed else None
+            mistakes = self.load_mistakes() if "mistakes.json" in changed else None
+        except (OSError, ValueError):
+            # 文件可能仍在写入，等待下一次变化事件
+            for name in changed:
+                self.file_signatures.pop(name, None)
+            return
+
+        messages = []
+        if subjects is not None or chapters is not None:
+            if subjects is not None:
+                self.subjects[:] = subjects
+            if chapters is not None:
+                self.chapters.clear()
+                self.chapters.update(chapters)
+            self.refresh_dropdowns()
+            messages.append("学科/章节")
+
+        if mistakes is not None:
+            added, updated, removed = self.merge_mistakes(mistakes, refresh_detail)
+            messages.append(f"错题 +{added} ~{updated} -{removed}")
+
+        self.data_changed()
+        self.update_mistake_list()
+        self.status_var.set(f"已同步外部修改: {'，'.join(messages)}")
+
+    def merge_mistakes(self, incoming, refresh_detail=True):
+        """按 id 对比外部数据：保留未变化的记录对象，原地更新修改过的记录"""
+        def keyed(records):
+            # 同一 id 出现多次时按出现顺序区分
+            seen = {}
+            for record in records:
+                record_id = record.get('id')
+                seen[record_id] = seen.get(record_id, -1) + 1
+                yield (record_id, seen[record_id]), record
+
+        current = dict(keyed(self.mistakes))
+        merged = []
+        added = updated = 0
+        for key, record in keyed(incoming):
+            existing = current.pop(key, None)
+            if existing is None:
+                merged.append(record)
+                added += 1
+            else:
+                if existing != record:
+                    existing.clear()
+                    existing.update(record)
+                    updated += 1
+                    if existing is self.current_mistake:
+                        # 即将保存用户的编辑时只刷新图片，不覆盖输入框中的内容
+                        if refresh_detail:
+                            self.show_mistake_detail()
+                        else:
+                            self.show_image()
+                merged.append(existing)
+
+        removed = len(current)
+        if self.current_mistake is not None and any(m is self.current_mistake for m in current.values()):
+            self.current_mistake = None
+            self.clear_mistake_detail()
+
+        self.mistakes[:] = merged
+        return added, updated, removed
+
+    def data_changed(self):
+        """数据写入后调用：推进数据代数并使依赖数据的缓存区域失效（二级索引通过失效回调一并丢弃）"""
+        with self.index_lock:
+            self.data_generation += 1
+        for region in self.DATA_CACHE_REGIONS:
+            self.cache.invalidate(region)
+
+    def on_cache_invalidated(self, region, key):
+        if region is None or region == "records":
+            self.invalidate_index()
+
+    def invalidate_index(self):
+        with self.index_lock:
+            self.mistake_index = None
+
+    def find_mistake(self, mistake_id):
+        """按 id 查找错题，id 映射表缓存在 records 区域"""
+        def build():
+            records = {}
+            for mistake in list(self.mistakes):
+                records.setdefault(mistake.get('id'), mistake)
+            return records
+
+        records = self.cache.get_or_create("records", "by_id", build, lambda r: 64 + 100 * len(r))
+        return records.get(mistake_id)
+
+    def get_mistake_index(self):
+        """返回二级索引；构建期间数据发生变化时，本次构建的索引只用于当前查询，不保存"""
+        with self.index_lock:
+            if self.mistake_index is not None:
+                return self.mistake_index
+            generation = self.data_generation
+        index = MistakeIndex(self.mistakes)
+        with self.index_lock:
+            if generation == self.data_generation:
+                self.mistake_index = index
+        return index
+
+    def query_mistakes(self, **criteria):
+        """按条件查询错题，参数见 MistakeIndex.query"""
+        return self.get_mistake_index().query(**criteria)
 
     def update_subject_dropdown(self):
         self.subject_combobox['values'] = self.subjects
@@ -387,19 +2022,65 @@ class EnhancedMistakeManager:
             if chapters:
                 self.chapter_combobox.current(0)
 
+    def refresh_dropdowns(self):
+        """更新学科和章节下拉框的选项，尽量保留当前选择"""
+        subject = self.subject_combobox.get()
+        chapter = self.chapter_combobox.get()
+
+        self.subject_combobox['values'] = self.subjects
+        if subject in self.subjects:
+            self.subject_combobox.set(subject)
+        elif self.subjects:
+            self.subject_combobox.current(0)
+        else:
+            self.subject_combobox.set("")
+
+        chapters = self.chapters.get(self.subject_combobox.get(), [])
+        self.chapter_combobox['values'] = chapters
+        if chapter in chapters:
+            self.chapter_combobox.set(chapter)
+        elif chapters:
+            self.chapter_combobox.current(0)
+        else:
+            self.chapter_combobox.set("")
+
     def subject_selected(self, event=None):
+        self.active_filter = None
         self.update_chapter_dropdown()
         self.update_mistake_list()
 
     def update_mistake_list(self):
         self.mistake_listbox.delete(0, tk.END)
-        subject = self.subject_combobox.get()
-        chapter = self.chapter_combobox.get()
 
-        if subject and chapter:
-            for mistake in self.mistakes:
-                if mistake['subject'] == subject and mistake['chapter'] == chapter:
-                    self.mistake_listbox.insert(tk.END, mistake['title'])
+        # 缓存 (错题列表, 显示文本)：保存记录本身而不是 id，重复的旧 id 也能对应到正确的行；
+        # 数据变更时 lists / search 区域整体失效
+        if self.active_filter is not None:
+            criteria = self.active_filter
+            key = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in criteria.items()))
+
+            def build():
+                results = self.query_mistakes(**criteria)
+                return results, [f"[{m['subject']}/{m['chapter']}] {m['title']}" for m in results]
+
+            try:
+                self.listed_mistakes, labels = self.cache.get_or_create("search", key, build)
+            except ValueError as e:
+                self.listed_mistakes, labels = [], []
+                self.status_var.set(f"筛选失败: {str(e)}")
+        else:
+            subject = self.subject_combobox.get()
+            chapter = self.chapter_combobox.get()
+
+            def build():
+                results = self.query_mistakes(chapters=[(subject, chapter)], sort_by=None)
+                return results, [m['title'] for m in results]
+
+            self.listed_mistakes, labels = [], []
+            if subject and chapter:
+                self.listed_mistakes, labels = self.cache.get_or_create("lists", (subject, chapter), build)
+
+        if labels:
+            self.mistake_listbox.insert(tk.END, *labels)
 
     def mistake_selected(self, event):
         selection = self.mistake_listbox.curselection()
@@ -407,31 +2088,134 @@ class EnhancedMistakeManager:
             return
 
         index = selection[0]
-        subject = self.subject_combobox.get()
-        chapter = self.chapter_combobox.get()
 
         # 查找选中的错题
         self.current_mistake = None
-        for mistake in self.mistakes:
-            if mistake['subject'] == subject and mistake['chapter'] == chapter:
-                if index == 0:
-                    self.current_mistake = mistake
-                    break
-                index -= 1
+        if index < len(self.listed_mistakes):
+            self.current_mistake = self.listed_mistakes[index]
 
         if self.current_mistake:
-            self.title_entry.delete(0, tk.END)
-            self.title_entry.insert(0, self.current_mistake['title'])
-            self.subject_var.set(self.current_mistake['subject'])
-            self.chapter_var.set(self.current_mistake['chapter'])
-            self.description_text.delete(1.0, tk.END)
-            self.description_text.insert(tk.END, self.current_mistake['description'])
-            self.answer_text.delete(1.0, tk.END)
-            self.answer_text.insert(tk.END, self.current_mistake['answer'])
-
-            # 显示图片
             self.current_image_index = 0
-            self.show_image()
+            self.show_mistake_detail()
+
+    def show_mistake_detail(self):
+        self.title_entry.delete(0, tk.END)
+        self.title_entry.insert(0, self.current_mistake['title'])
+        self.subject_var.set(self.current_mistake['subject'])
+        self.chapter_var.set(self.current_mistake['chapter'])
+        self.description_text.delete(1.0, tk.END)
+        self.description_text.insert(tk.END, self.current_mistake['description'])
+        self.answer_text.delete(1.0, tk.END)
+        self.answer_text.insert(tk.END, self.current_mistake['answer'])
+
+        # 显示图片
+        images = self.current_mistake.get('images', [])
+        if self.current_image_index >= len(images):
+            self.current_image_index = max(0, len(images) - 1)
+        self.show_image()
+
+    def clear_mistake_detail(self):
+        self.title_entry.delete(0, tk.END)
+        self.description_text.delete(1.0, tk.END)
+        self.answer_text.delete(1.0, tk.END)
+        self.subject_var.set("")
+        self.chapter_var.set("")
+        self.show_image()
+
+    def show_filter_panel(self):
+        """高级筛选面板：多学科、日期区间、图片、答案组合筛选"""
+        panel = tk.Toplevel(self.root)
+        panel.title("高级筛选")
+        panel.configure(bg='#f5f7fa')
+        panel.transient(self.root)
+        panel.resizable(False, False)
+
+        frame = ttk.Frame(panel, padding=(15, 10))
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(frame, text="学科（可多选，不选表示全部）:", font=self.title_font).grid(row=0, column=0, columnspan=2, sticky=tk.W)
+        subject_listbox = tk.Listbox(frame, selectmode=tk.MULTIPLE, height=6, exportselection=False,
+                                     bg="white", fg="#333333", selectbackground="#4da6ff",
+                                     selectforeground="white", font=self.default_font)
+        subject_listbox.grid(row=1, column=0, columnspan=2, sticky=tk.EW, pady=5)
+        for subject in self.subjects:
+            subject_listbox.insert(tk.END, subject)
+
+        last = self.active_filter or {}
+        if last.get('subjects'):
+            for i, subject in enumerate(self.subjects):
+                if subject in last['subjects']:
+                    subject_listbox.selection_set(i)
+
+        ttk.Label(frame, text="开始日期:").grid(row=2, column=0, sticky=tk.W, pady=3)
+        date_from_entry = ttk.Entry(frame, width=20)
+        date_from_entry.grid(row=2, column=1, sticky=tk.W, pady=3)
+        date_from_entry.insert(0, last.get('date_from') or "")
+
+        ttk.Label(frame, text="结束日期:").grid(row=3, column=0, sticky=tk.W, pady=3)
+        date_to_entry = ttk.Entry(frame, width=20)
+        date_to_entry.grid(row=3, column=1, sticky=tk.W, pady=3)
+        date_to_entry.insert(0, last.get('date_to') or "")
+
+        ttk.Label(frame, text="（格式：YYYY-MM-DD，留空表示不限）").grid(row=4, column=0, columnspan=2, sticky=tk.W)
+
+        tri_state = {"不限": None, "是": True, "否": False}
+        tri_label = {v: k for k, v in tri_state.items()}
+
+        ttk.Label(frame, text="包含图片:").grid(row=5, column=0, sticky=tk.W, pady=3)
+        images_combobox = ttk.Combobox(frame, state="readonly", width=10, values=list(tri_state))
+        images_combobox.grid(row=5, column=1, sticky=tk.W, pady=3)
+        images_combobox.set(tri_label[last.get('has_images')])
+
+        ttk.Label(frame, text="缺少答案:").grid(row=6, column=0, sticky=tk.W, pady=3)
+        answer_combobox = ttk.Combobox(frame, state="readonly", width=10, values=list(tri_state))
+        answer_combobox.grid(row=6, column=1, sticky=tk.W, pady=3)
+        answer_combobox.set(tri_label[last.get('answer_missing')])
+
+        sort_options = {"日期": "date", "标题": "title", "学科/章节": "subject"}
+        sort_label = {v: k for k, v in sort_options.items()}
+
+        ttk.Label(frame, text="排序方式:").grid(row=7, column=0, sticky=tk.W, pady=3)
+        sort_combobox = ttk.Combobox(frame, state="readonly", width=10, values=list(sort_options))
+        sort_combobox.grid(row=7, column=1, sticky=tk.W, pady=3)
+        sort_combobox.set(sort_label.get(last.get('sort_by'), "日期"))
+
+        reverse_var = tk.BooleanVar(value=last.get('reverse', True))
+        ttk.Checkbutton(frame, text="倒序（最新在前）", variable=reverse_var).grid(row=8, column=0, columnspan=2, sticky=tk.W, pady=3)
+
+        def apply_filter():
+            selected = [subject_listbox.get(i) for i in subject_listbox.curselection()]
+            criteria = {
+                "subjects": selected or None,
+                "date_from": date_from_entry.get().strip() or None,
+                "date_to": date_to_entry.get().strip() or None,
+                "has_images": tri_state[images_combobox.get()],
+                "answer_missing": tri_state[answer_combobox.get()],
+                "sort_by": sort_options[sort_combobox.get()],
+                "reverse": reverse_var.get(),
+            }
+            try:
+                self.query_mistakes(**criteria)
+            except ValueError as e:
+                messagebox.showwarning("警告", str(e), parent=panel)
+                return
+
+            self.active_filter = criteria
+            self.update_mistake_list()
+            self.status_var.set(f"筛选结果: {len(self.listed_mistakes)} 道错题")
+            panel.destroy()
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.grid(row=9, column=0, columnspan=2, sticky=tk.EW, pady=(10, 0))
+        ttk.Button(btn_frame, text="应用筛选", command=apply_filter, style="Accent.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="取消", command=panel.destroy).pack(side=tk.LEFT, padx=5)
+
+    def clear_filter(self):
+        if self.active_filter is None:
+            return
+        self.active_filter = None
+        self.update_mistake_list()
+        self.status_var.set("已清除筛选")
 
     def show_image(self):
         if self.current_mistake and 'images' in self.current_mistake and self.current_mistake['images']:
@@ -442,21 +2226,30 @@ class EnhancedMistakeManager:
                 image_path = images[self.current_image_index]
                 if os.path.exists(image_path):
                     try:
-                        img = Image.open(image_path)
-
                         # 动态调整图片大小以适应窗口
                         max_width = 500
                         max_height = 300
 
-                        # 计算缩放比例
-                        width_ratio = max_width / img.width
-                        height_ratio = max_height / img.height
-                        scale = min(width_ratio, height_ratio)
+                        # 缩放后的图片按路径缓存，文件被修改（大小或时间变化）时重新解码
+                        key = (image_path, max_width, max_height)
+                        signature = file_signature(image_path)
+                        cached = self.cache.get("images", key)
+                        if cached is not None and cached[0] == signature:
+                            img = cached[1]
+                        else:
+                            # JPEG 按目标尺寸缩小解码，大图无需完整解码
+                            img = open_reduced(image_path, (max_width, max_height))
+
+                            # 计算缩放比例
+                            width_ratio = max_width / img.width
+                            height_ratio = max_height / img.height
+                            scale = min(width_ratio, height_ratio)
 
-                        new_width = int(img.width * scale)
-                        new_height = int(img.height * scale)
+                            new_width = int(img.width * scale)
+                            new_height = int(img.height * scale)
 
-                        img = img.resize((new_width, new_height), Image.LANCZOS)
+                            img = img.resize((new_width, new_height), Image.LANCZOS)
+                            self.cache.put("images", key, (signature, img), estimate_size(img))
 
                         photo = ImageTk.PhotoImage(img)
                         self.image_label.configure(image=photo)
@@ -471,6 +2264,26 @@ class EnhancedMistakeManager:
         self.image_label.image = None
         self.image_nav_label.configure(text="0/0")
 
+    def open_image_viewer(self):
+        if not self.current_mistake or not self.current_mistake.get('images'):
+            return
+
+        images = self.current_mistake['images']
+        if self.current_image_index >= len(images):
+            return
+
+        image_path = images[self.current_image_index]
+        if not os.path.exists(image_path):
+            self.status_var.set(f"图片不存在: {image_path}")
+            return
+
+        try:
+            viewer = ImageZoomViewer(self.root, image_path, self.cache,
+                                     title=f"{self.current_mistake['title']} - 图片 {self.current_image_index + 1}/{len(images)}")
+            self.image_viewers = [v for v in self.image_viewers if not v.closed] + [viewer]
+        except Exception as e:
+            self.status_var.set(f"图片加载错误: {str(e)}")
+
     def prev_image(self):
         if self.current_mistake and 'images' in self.current_mistake:
             images = self.current_mistake['images']
@@ -485,7 +2298,18 @@ class EnhancedMistakeManager:
                 self.current_image_index = (self.current_image_index + 1) % len(images)
                 self.show_image()
 
+    def check_writable(self):
+        """修改数据前调用：只读模式下拒绝修改，否则先合并尚未处理的外部修改，避免保存时覆盖"""
+        if self.read_only:
+            messagebox.showwarning("只读模式", "当前为只读模式，无法修改数据", parent=self.root)
+            return False
+        self.apply_external_changes(DataDirWatcher.WATCHED_FILES, refresh_detail=False)
+        return True
+
     def add_subject(self):
+        if not self.check_writable():
+            return
+
         subject = simpledialog.askstring("添加学科", "请输入学科名称:", parent=self.root)
         if subject and subject not in self.subjects:
             self.subjects.append(subject)
@@ -496,6 +2320,9 @@ class EnhancedMistakeManager:
             self.status_var.set(f"已添加学科: {subject}")
 
     def delete_subject(self):
+        if not self.check_writable():
+            return
+
         subject = self.subject_combobox.get()
         if subject and subject in self.subjects:
             if messagebox.askyesno("确认删除", f"确定要删除学科 '{subject}' 及其所有章节和错题吗？", parent=self.root):
@@ -514,6 +2341,9 @@ class EnhancedMistakeManager:
                 self.status_var.set(f"已删除学科: {subject}")
 
     def add_chapter(self):
+        if not self.check_writable():
+            return
+
         subject = self.subject_combobox.get()
         if not subject:
             messagebox.showwarning("警告", "请先选择一个学科", parent=self.root)
@@ -527,6 +2357,9 @@ class EnhancedMistakeManager:
             self.status_var.set(f"已添加章节: {chapter}")
 
     def delete_chapter(self):
+        if not self.check_writable():
+            return
+
         subject = self.subject_combobox.get()
         chapter = self.chapter_combobox.get()
 
@@ -545,6 +2378,9 @@ class EnhancedMistakeManager:
                 self.status_var.set(f"已删除章节: {chapter}")
 
     def add_mistake(self):
+        if not self.check_writable():
+            return
+
         subject = self.subject_combobox.get()
         chapter = self.chapter_combobox.get()
 
@@ -561,19 +2397,17 @@ class EnhancedMistakeManager:
             return
 
         # 创建新错题
-        new_mistake = {
-            "id": datetime.datetime.now().strftime("%Y%m%d%H%M%S%f"),
-            "subject": subject,
-            "chapter": chapter,
-            "title": title,
-            "description": description,
-            "answer": answer,
-            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "images": []
-        }
-
-        self.mistakes.append(new_mistake)
-        self.save_mistakes()
+        try:
+            self.add_many([{
+                "subject": subject,
+                "chapter": chapter,
+                "title": title,
+                "description": description,
+                "answer": answer,
+            }])
+        except ValueError as e:
+            messagebox.showwarning("警告", str(e), parent=self.root)
+            return
         self.update_mistake_list()
 
         # 清空输入框
@@ -585,7 +2419,221 @@ class EnhancedMistakeManager:
 
         self.status_var.set(f"已添加错题: {title}")
 
+    def add_many(self, records, create_missing=False):
+        """批量添加错题：全部校验通过后统一分配 ID，只写一次文件，返回新增的错题列表
+
+        records 中每条为字典，至少包含 subject、chapter、title、description，可选 answer、date、images。
+        images 中的图片在分配 ID 后复制到图片目录，按 "<ID>_<原文件名>" 命名，与上传图片一致。
+        create_missing 为 True 时自动创建不存在的学科和章节，否则视为错误。
+        任意一条不合法时抛出 ValueError，不会添加任何数据。
+        """
+        if self.read_only:
+            raise PermissionError("当前为只读模式，无法修改数据")
+
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        prepared = []
+        errors = []
+        new_chapters = {}
+
+        for number, record in enumerate(records, 1):
+            if not isinstance(record, dict):
+                errors.append(f"第 {number} 条: 错题记录必须是字典")
+                continue
+
+            subject = str(record.get('subject', '')).strip()
+            chapter = str(record.get('chapter', '')).strip()
+            title = str(record.get('title', '')).strip()
+            description = str(record.get('description', '')).strip()
+            images = record.get('images') or []
+
+            if not subject or not chapter:
+                errors.append(f"第 {number} 条: 学科和章节不能为空")
+            elif chapter not in self.chapters.get(subject, []):
+                if create_missing:
+                    new_chapters.setdefault(subject, [])
+                    if chapter not in new_chapters[subject]:
+                        new_chapters[subject].append(chapter)
+                else:
+                    errors.append(f"第 {number} 条: 学科或章节不存在: {subject}/{chapter}")
+
+            if not title or not description:
+                errors.append(f"第 {number} 条: 标题和题目描述不能为空")
+
+            date = now
+            if record.get('date'):
+                date = MistakeIndex.normalize_date(record['date'])
+                if date is None:
+                    errors.append(f"第 {number} 条: 无法识别的日期: {record['date']}")
+
+            if not isinstance(images, list) or not all(isinstance(p, str) for p in images):
+                errors.append(f"第 {number} 条: images 必须是图片路径列表")
+            else:
+                for path in images:
+                    if not os.path.isfile(path):
+                        errors.append(f"第 {number} 条: 图片不存在: {path}")
+
+            prepared.append({
+                "subject": subject,
+                "chapter": chapter,
+                "title": title,
+                "description": description,
+                "answer": str(record.get('answer', '') or '').strip(),
+                "date": date,
+                "images": list(images) if isinstance(images, list) else [],
+            })
+
+        if errors:
+            shown = errors[:20]
+            if len(errors) > len(shown):
+                shown.append(f"……共 {len(errors)} 处错误")
+            raise ValueError("\n".join(shown))
+
+        for mistake in prepared:
+            mistake["id"] = self.id_generator.new_id()
+
+        # 复制图片到数据目录；失败时删除已复制的文件，不添加任何数据
+        copied = []
+        try:
+            for mistake in prepared:
+                images = []
+                for path in mistake["images"]:
+                    dest_path = os.path.join(self.image_dir, f"{mistake['id']}_{os.path.basename(path)}")
+                    if dest_path in images:
+                        dest_path = os.path.join(self.image_dir,
+                                                 f"{mistake['id']}_{len(images)}_{os.path.basename(path)}")
+                    shutil.copyfile(path, dest_path)
+                    copied.append(dest_path)
+                    images.append(dest_path)
+                mistake["images"] = images
+        except OSError:
+            for path in copied:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+
+        if new_chapters:
+            for subject, chapters in new_chapters.items():
+                if subject not in self.subjects:
+                    self.subjects.append(subject)
+                self.chapters.setdefault(subject, []).extend(chapters)
+            self.save_subjects()
+            self.save_chapters()
+
+        self.mistakes.extend(prepared)
+        self.save_mistakes()
+        return prepared
+
+    def migrate_mistake_ids(self):
+        """把旧格式（时间戳字符串）或重复的 ID 换成新 ID，同时重命名以旧 ID 开头的图片文件
+
+        新 ID 沿用旧 ID 的时间，排序不变。仍被保留原 ID 的记录引用的图片复制一份而不是改名。
+        迁移前先把 mistakes.json 备份到 backup 目录下带时间的文件中；保存失败时撤销改名和复制，提示后继续使用旧 ID。
+        """
+        if self.read_only:
+            return 0
+
+        seen = set()
+        remapped = []
+        for mistake in self.mistakes:
+            old_id = mistake.get('id')
+            if MonotonicIdGenerator.is_valid(old_id) and old_id not in seen:
+                seen.add(old_id)
+                continue
+
+            timestamp = MonotonicIdGenerator.legacy_timestamp(mistake)
+            new_id = (MonotonicIdGenerator.id_for_timestamp(timestamp)
+                      if timestamp is not None else self.id_generator.new_id())
+            while new_id in seen:
+                new_id = self.id_generator.new_id()
+            seen.add(new_id)
+            remapped.append((mistake, old_id, new_id))
+
+        if not remapped:
+            return 0
+
+        # 备份迁移前的数据
+        file_path = os.path.join(self.data_dir, "mistakes.json")
+        try:
+            if os.path.exists(file_path):
+                backup_dir = os.path.join(self.data_dir, "backup")
+                if not os.path.exists(backup_dir):
+                    os.makedirs(backup_dir)
+                # 备份文件名带时间，之后再次迁移（如导入旧数据）不会覆盖之前的备份
+                stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+                backup_path = os.path.join(backup_dir, f"mistakes.before-id-migration.{stamp}.json")
+                counter = 1
+                while os.path.exists(backup_path):
+                    backup_path = os.path.join(backup_dir, f"mistakes.before-id-migration.{stamp}-{counter}.json")
+                    counter += 1
+                shutil.copy(file_path, backup_path)
+        except OSError as e:
+            messagebox.showwarning("ID 迁移失败", f"无法备份错题数据，暂不迁移 ID:\n{str(e)}", parent=self.root)
+            return 0
+
+        # 保留原 ID 的记录仍引用的图片不能改名
+        remapped_records = {id(mistake) for mistake, _, _ in remapped}
+        kept_paths = {path for mistake in self.mistakes if id(mistake) not in remapped_records
+                      for path in mistake.get('images', [])}
+
+        image_dir = os.path.abspath(self.image_dir)
+        renamed = {}
+        copied = {}
+        old_images = []
+        for mistake, old_id, new_id in remapped:
+            old_images.append(list(mistake.get('images', [])))
+            mistake['id'] = new_id
+            prefix = f"{old_id}_"
+            images = []
+            for path in mistake.get('images', []):
+                if path in renamed or path in copied:
+                    images.append(renamed.get(path) or copied[path])
+                    continue
+                name = os.path.basename(path)
+                if (old_id and name.startswith(prefix) and os.path.exists(path)
+                        and os.path.dirname(os.path.abspath(path)) == image_dir):
+                    new_path = os.path.join(os.path.dirname(path), new_id + "_" + name[len(prefix):])
+                    if not os.path.exists(new_path):
+                        try:
+                            if path in kept_paths:
+                                shutil.copyfile(path, new_path)
+                                copied[path] = new_path
+                            else:
+                                os.rename(path, new_path)
+                                renamed[path] = new_path
+                            path = new_path
+                        except OSError:
+                            pass
+                images.append(path)
+            mistake['images'] = images
+
+        try:
+            self.save_mistakes()
+        except (OSError, ValueError) as e:
+            # 保存失败：撤销改名、复制和 ID，保持与磁盘上的数据一致
+            for old_path, new_path in renamed.items():
+                try:
+                    os.rename(new_path, old_path)
+                except OSError:
+                    pass
+            for new_path in copied.values():
+                try:
+                    os.remove(new_path)
+                except OSError:
+                    pass
+            for (mistake, old_id, _), images in zip(remapped, old_images):
+                mistake['id'] = old_id
+                mistake['images'] = images
+            messagebox.showwarning("ID 迁移失败", f"保存错题数据失败，继续使用旧 ID:\n{str(e)}", parent=self.root)
+            return 0
+
+        return len(remapped)
+
     def update_mistake(self):
+        if not self.check_writable():
+            return
+
         if not self.current_mistake:
             messagebox.showwarning("警告", "请先选择一个错题", parent=self.root)
             return
@@ -609,6 +2657,9 @@ class EnhancedMistakeManager:
         self.status_var.set(f"已更新错题: {title}")
 
     def delete_mistake(self):
+        if not self.check_writable():
+            return
+
         if not self.current_mistake:
             messagebox.showwarning("警告", "请先选择一个错题", parent=self.root)
             return
@@ -629,6 +2680,9 @@ class EnhancedMistakeManager:
             self.status_var.set(f"已删除错题: {title}")
 
     def upload_image(self):
+        if not self.check_writable():
+            return
+
         if not self.current_mistake:
             messagebox.showwarning("警告", "请先选择一个错题", parent=self.root)
             return
@@ -656,6 +2710,9 @@ class EnhancedMistakeManager:
             self.status_var.set(f"已添加 {len(file_paths)} 张图片")
 
     def delete_image(self):
+        if not self.check_writable():
+            return
+
         if not self.current_mistake or not self.current_mistake.get('images'):
             return
 
@@ -666,6 +2723,7 @@ class EnhancedMistakeManager:
         if self.current_image_index < len(images):
             # 删除图片文件
             img_path = images[self.current_image_index]
+            self.cache.invalidate("images", match=lambda key: key[0] == img_path)
             try:
                 if os.path.exists(img_path):
                     os.remove(img_path)
@@ -701,12 +2759,17 @@ class EnhancedMistakeManager:
 
         try:
             with zipfile.ZipFile(export_path, 'w') as zipf:
-                # 添加数据文件
-                data_files = ["subjects.json", "chapters.json", "mistakes.json"]
-                for file in data_files:
-                    file_path = os.path.join(self.data_dir, file)
-                    if os.path.exists(file_path):
-                        zipf.write(file_path, arcname=file)
+                # 添加数据文件：直接编码内存中的数据，与存储使用同一套编码
+                data_files = {
+                    "subjects.json": list(self.subjects),
+                    "chapters.json": dict(self.chapters),
+                    "mistakes.json": list(self.mistakes),
+                }
+                for file, obj in data_files.items():
+                    codec, compression = self.storage_format(file)
+                    data = encode_data(obj, codec, compression)
+                    compress_type = zipfile.ZIP_DEFLATED if compression == "none" else zipfile.ZIP_STORED
+                    zipf.writestr(file, data, compress_type=compress_type)
 
                 # 添加图片
                 if os.path.exists(self.image_dir):
@@ -722,7 +2785,166 @@ class EnhancedMistakeManager:
             self.status_var.set(f"导出失败: {str(e)}")
             messagebox.showerror("导出失败", f"导出数据时出错:\n{str(e)}", parent=self.root)
 
+    def show_worksheet_dialog(self):
+        """选择学科、章节和日期区间，生成练习卷"""
+        all_subjects = "全部学科"
+        all_chapters = "全部章节"
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("生成练习卷")
+        dialog.configure(bg='#f5f7fa')
+        dialog.transient(self.root)
+        dialog.resizable(False, False)
+
+        frame = ttk.Frame(dialog, padding=(15, 10))
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(frame, text="学科:").grid(row=0, column=0, sticky=tk.W, pady=3)
+        subject_combobox = ttk.Combobox(frame, state="readonly", width=18, values=[all_subjects] + self.subjects)
+        subject_combobox.grid(row=0, column=1, sticky=tk.W, pady=3)
+        subject_combobox.set(self.subject_combobox.get() or all_subjects)
+
+        ttk.Label(frame, text="章节:").grid(row=1, column=0, sticky=tk.W, pady=3)
+        chapter_combobox = ttk.Combobox(frame, state="readonly", width=18)
+        chapter_combobox.grid(row=1, column=1, sticky=tk.W, pady=3)
+
+        def refresh_chapters(event=None):
+            subject = subject_combobox.get()
+            chapter_combobox['values'] = [all_chapters] + self.chapters.get(subject, [])
+            chapter_combobox.set(all_chapters)
+
+        subject_combobox.bind('<<ComboboxSelected>>', refresh_chapters)
+        refresh_chapters()
+
+        today = datetime.date.today()
+        ttk.Label(frame, text="开始日期:").grid(row=2, column=0, sticky=tk.W, pady=3)
+        date_from_entry = ttk.Entry(frame, width=20)
+        date_from_entry.grid(row=2, column=1, sticky=tk.W, pady=3)
+        date_from_entry.insert(0, (today - datetime.timedelta(days=30)).strftime("%Y-%m-%d"))
+
+        ttk.Label(frame, text="结束日期:").grid(row=3, column=0, sticky=tk.W, pady=3)
+        date_to_entry = ttk.Entry(frame, width=20)
+        date_to_entry.grid(row=3, column=1, sticky=tk.W, pady=3)
+        date_to_entry.insert(0, today.strftime("%Y-%m-%d"))
+
+        ttk.Label(frame, text="标题:").grid(row=4, column=0, sticky=tk.W, pady=3)
+        title_entry = ttk.Entry(frame, width=30)
+        title_entry.grid(row=4, column=1, sticky=tk.W, pady=3)
+        title_entry.insert(0, "错题练习卷")
+
+        answers_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frame, text="附参考答案（单独分页）", variable=answers_var).grid(row=5, column=0, columnspan=2, sticky=tk.W, pady=3)
+
+        pdf_var = tk.BooleanVar(value=False)
+        pdf_check = ttk.Checkbutton(frame, text="同时导出 PDF", variable=pdf_var)
+        pdf_check.grid(row=6, column=0, columnspan=2, sticky=tk.W, pady=3)
+        if WeasyHTML is None:
+            pdf_check.state(["disabled"])
+
+        def generate():
+            subject = subject_combobox.get()
+            chapter = chapter_combobox.get()
+            criteria = {
+                "date_from": date_from_entry.get().strip() or None,
+                "date_to": date_to_entry.get().strip() or None,
+                "sort_by": "subject",
+            }
+            if subject != all_subjects:
+                criteria["subjects"] = [subject]
+                if chapter != all_chapters:
+                    criteria["chapters"] = [(subject, chapter)]
+
+            try:
+                selected = self.query_mistakes(**criteria)
+            except ValueError as e:
+                messagebox.showwarning("警告", str(e), parent=dialog)
+                return
+
+            if not selected:
+                messagebox.showwarning("警告", "没有符合条件的错题", parent=dialog)
+                return
+
+            output_path = filedialog.asksaveasfilename(
+                title="保存练习卷",
+                filetypes=[("HTML 文件", "*.html")],
+                defaultextension=".html",
+                parent=dialog
+            )
+            if not output_path:
+                return
+
+            pdf_path = os.path.splitext(output_path)[0] + ".pdf" if pdf_var.get() else None
+            title = title_entry.get().strip() or "错题练习卷"
+            dialog.destroy()
+
+            # 在后台执行生成操作
+            threading.Thread(target=self._perform_worksheet,
+                             args=(selected, output_path, title, answers_var.get(), pdf_path),
+                             daemon=True).start()
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.grid(row=7, column=0, columnspan=2, sticky=tk.EW, pady=(10, 0))
+        ttk.Button(btn_frame, text="生成", command=generate, style="Accent.TButton").pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="取消", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+    def _perform_worksheet(self, mistakes, output_path, title, include_answers, pdf_path):
+        self.status_var.set(f"正在生成练习卷（{len(mistakes)} 题），请稍候...")
+
+        try:
+            count, failed_images = generate_worksheet(mistakes, output_path, title=title,
+                                                      include_answers=include_answers, pdf_path=pdf_path)
+            target = f"{output_path}\n{pdf_path}" if pdf_path else output_path
+            if failed_images:
+                self.status_var.set(f"练习卷已生成（{count} 题，{failed_images} 张图片无法加载）: {output_path}")
+                messagebox.showwarning("生成完成", f"练习卷已生成，但有 {failed_images} 张图片无法加载，"
+                                       f"已在对应位置标出:\n{target}", parent=self.root)
+            else:
+                self.status_var.set(f"练习卷已生成（{count} 题）: {output_path}")
+                messagebox.showinfo("生成成功", f"练习卷已生成:\n{target}", parent=self.root)
+        except Exception as e:
+            self.status_var.set(f"生成练习卷失败: {str(e)}")
+            messagebox.showerror("生成失败", f"生成练习卷时出错:\n{str(e)}", parent=self.root)
+
+    def toggle_http_server(self):
+        if self.http_server is not None:
+            self.stop_http_server()
+            return
+
+        port = simpledialog.askinteger("共享服务", "请输入端口号:", parent=self.root,
+                                       initialvalue=8765, minvalue=1, maxvalue=65535)
+        if port:
+            self.start_http_server(port=port)
+
+    def start_http_server(self, host="0.0.0.0", port=8765):
+        try:
+            self.http_server = MistakeHTTPServer(self, host, port)
+        except OSError as e:
+            self.http_server = None
+            messagebox.showerror("共享服务", f"无法启动共享服务:\n{str(e)}", parent=self.root)
+            return
+
+        self.http_server.start()
+        self.share_button.configure(text="停止共享")
+
+        try:
+            address = socket.gethostbyname(socket.gethostname())
+        except OSError:
+            address = "127.0.0.1"
+        self.status_var.set(f"共享服务已启动: http://{address}:{port}/api/tree")
+
+    def stop_http_server(self):
+        if self.http_server is None:
+            return
+        server = self.http_server
+        self.http_server = None
+        threading.Thread(target=server.stop, daemon=True).start()
+        self.share_button.configure(text="共享服务")
+        self.status_var.set("共享服务已停止")
+
     def import_data(self):
+        if not self.check_writable():
+            return
+
         import_path = filedialog.askopenfilename(
             title="导入数据",
             filetypes=[("ZIP 压缩包", "*.zip")]
@@ -762,6 +2984,8 @@ class EnhancedMistakeManager:
             self.subjects = self.load_subjects()
             self.chapters = self.load_chapters()
             self.mistakes = self.load_mistakes()
+            self.migrate_mistake_ids()
+            self.data_changed()
 
             # 更新UI
             self.root.after(0, self.update_subject_dropdown)
@@ -779,6 +3003,49 @@ class EnhancedMistakeManager:
             self.status_var.set(f"导入失败: {str(e)}")
             messagebox.showerror("导入失败", f"导入数据时出错:\n{str(e)}", parent=self.root)
 
+    def show_cache_panel(self):
+        """调试面板：各缓存区域的条目数、占用、命中率和淘汰次数，每秒刷新"""
+        panel = tk.Toplevel(self.root)
+        panel.title("缓存统计")
+        panel.configure(bg='#f5f7fa')
+        panel.transient(self.root)
+
+        text = tk.Text(panel, width=90, height=14, font=("Courier New", 10), bg="#f8f9fa", padx=10, pady=10)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+
+        def refresh():
+            if not panel.winfo_exists():
+                return
+            text.configure(state=tk.NORMAL)
+            text.delete(1.0, tk.END)
+            text.insert(tk.END, self.cache.format_stats())
+            text.configure(state=tk.DISABLED)
+            panel.refresh_job = panel.after(1000, refresh)
+
+        def clear():
+            self.cache.invalidate()
+            self.status_var.set("已清空缓存")
+
+        def close():
+            panel.after_cancel(panel.refresh_job)
+            panel.destroy()
+
+        btn_frame = ttk.Frame(panel)
+        btn_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ttk.Button(btn_frame, text="清空缓存", command=clear).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="关闭", command=close).pack(side=tk.LEFT, padx=5)
+        panel.protocol("WM_DELETE_WINDOW", close)
+
+        refresh()
+
+    def on_close(self):
+        for viewer in self.image_viewers:
+            viewer.close()
+        self.watcher.stop()
+        self.stop_http_server()
+        self.data_lock.release()
+        self.root.destroy()
+
     def show_help(self):
         help_text = """
         【学霸错题本使用指南】
@@ -795,15 +3062,23 @@ class EnhancedMistakeManager:
           - 添加错题：填写标题、题目描述和正确答案后点击"添加错题"
           - 更新错题：修改内容后点击"更新错题"
           - 删除错题：选择错题后点击"删除错题"
+          - 高级筛选：按多个学科、日期区间、是否有图片、是否缺少答案组合筛选
+          - 清除筛选：回到当前学科和章节的错题列表
         
         4. 图片管理
           - 添加图片：选择错题后点击"添加图片"按钮
           - 删除图片：在图片显示时点击"删除图片"按钮
           - 切换图片：使用"上一张"和"下一张"按钮
+          - 放大查看：点击"放大查看"或双击图片，滚轮缩放、拖动平移
         
         5. 数据管理
           - 导出数据：将所有错题导出为ZIP文件
+          - 同步修改：其他程序修改数据目录后会自动合并到当前窗口
+          - 只读模式：同一数据目录已被另一个窗口打开时，只能以只读模式浏览
+          - 缓存统计：按 F12 查看缓存占用和命中率
           - 导入数据：从ZIP文件导入错题数据
+          - 生成练习卷：按学科、章节和日期挑选错题，生成可打印的 HTML（可选 PDF），答案单独分页
+          - 共享服务：在局域网内以只读方式共享错题本，平板等设备可通过浏览器访问 /api/tree
         
         提示：定期导出数据以防丢失！
         """
@@ -829,6 +3104,27 @@ class EnhancedMistakeManager:
         messagebox.showinfo("关于软件", about_text, parent=self.root)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="学霸错题本")
+    parser.add_argument("--serve", action="store_true", help="启动时开启局域网只读共享服务")
+    parser.add_argument("--host", default="0.0.0.0", help="共享服务监听地址（默认 0.0.0.0）")
+    parser.add_argument("--port", type=int, default=8765, help="共享服务端口（默认 8765）")
+    parser.add_argument("--cache-mb", type=int, default=64, help="缓存总大小上限，单位 MB（默认 64）")
+    parser.add_argument("--cache-stats", action="store_true", help="退出时打印缓存统计")
+    parser.add_argument("--codec", choices=list(STORAGE_CODECS),
+                        help="数据文件编码方式（默认沿用现有文件的格式，新文件为 json）")
+    parser.add_argument("--compression", choices=list(STORAGE_COMPRESSIONS),
+                        help="数据文件压缩方式（默认沿用现有文件的格式，新文件不压缩）")
+    args = parser.parse_args()
+    if args.codec and not STORAGE_CODECS[args.codec][3]():
+        parser.error(f"编码方式 {args.codec} 需要安装 {args.codec}")
+    if args.compression and not STORAGE_COMPRESSIONS[args.compression][3]():
+        parser.error(f"压缩方式 {args.compression} 需要安装 zstandard")
+
     root = tk.Tk()
-    app = EnhancedMistakeManager(root)
-    root.mainloop()
\ No newline at end of file
+    app = EnhancedMistakeManager(root, cache_bytes=args.cache_mb * 1024 * 1024,
+                                 codec=args.codec, compression=args.compression)
+    if args.serve:
+        app.start_http_server(args.host, args.port)
+    root.mainloop()
+    if args.cache_stats:
+        print(app.cache.format_stats())
\ No newline at end of file